@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Klaviyo Size Backfill
+Sets last_purchase_size and predicted_next_size on every customer from a Shopify order export
+"""
+
+import argparse
+import csv
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from upload_templates import KlaviyoAutomation
+
+# Children's clothing sizes (cm) in the order a child grows through them
+SIZE_PROGRESSION = ["50", "56", "62", "68", "74", "80", "86", "92", "98", "104",
+                    "110", "116", "122", "128", "134", "140", "146", "152"]
+SIZE_RE = re.compile(r"(?<!\d)(%s)(?!\d)" % "|".join(sorted(SIZE_PROGRESSION, key=len, reverse=True)))
+
+# Column names in Shopify's "Export orders" CSV
+ORDER_COLUMN = "Name"
+EMAIL_COLUMN = "Email"
+DATE_COLUMN = "Created at"
+SIZE_COLUMNS = ["Lineitem variant", "Lineitem name", "Lineitem sku"]
+
+
+def find_size(row: Dict[str, str], columns: List[str]) -> Optional[str]:
+    """First children's size mentioned in the given columns ("Body - 74 / Blå" -> "74")"""
+    for column in columns:
+        match = SIZE_RE.search(row.get(column) or "")
+        if match:
+            return match.group(1)
+    return None
+
+
+def predict_next_size(size: str) -> str:
+    index = SIZE_PROGRESSION.index(size)
+    return SIZE_PROGRESSION[min(index + 1, len(SIZE_PROGRESSION) - 1)]
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    for fmt in ("%Y-%m-%d %H:%M:%S %z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def latest_sizes(order_file: str, size_columns: List[str] = SIZE_COLUMNS) -> Dict[str, str]:
+    """Map each customer email to the largest size in their most recent sized order"""
+    latest = {}
+    orders = {}
+    with open(order_file, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            # Extra line item rows of an order can leave the order-level columns blank
+            order = orders.setdefault(row.get(ORDER_COLUMN), {})
+            for column in (EMAIL_COLUMN, DATE_COLUMN):
+                if row.get(column):
+                    order[column] = row[column]
+                else:
+                    row[column] = order.get(column, "")
+            email = (row.get(EMAIL_COLUMN) or "").strip().lower()
+            size = find_size(row, size_columns)
+            ordered = _parse_date(row.get(DATE_COLUMN) or "")
+            if not email or not size or not ordered:
+                continue
+            key = ordered.timestamp()
+            current = latest.get(email)
+            if current is None or key > current[0]:
+                latest[email] = (key, size)
+            elif key == current[0] and SIZE_PROGRESSION.index(size) > SIZE_PROGRESSION.index(current[1]):
+                latest[email] = (key, size)
+    return {email: size for email, (_, size) in latest.items()}
+
+
+def size_profiles(sizes: Dict[str, str]) -> List[Dict]:
+    return [
+        {
+            "email": email,
+            "properties": {
+                "last_purchase_size": size,
+                "predicted_next_size": predict_next_size(size)
+            }
+        }
+        for email, size in sorted(sizes.items())
+    ]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Backfill size properties from a Shopify order export")
+    parser.add_argument("orders", help="Shopify order export CSV")
+    parser.add_argument("--size-column", action="append", dest="size_columns",
+                        help=f"Column to read sizes from (repeatable, default: {', '.join(SIZE_COLUMNS)})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what would be imported without calling Klaviyo")
+    args = parser.parse_args(argv)
+
+    print("📏 Reading sizes from order export...")
+    sizes = latest_sizes(args.orders, args.size_columns or SIZE_COLUMNS)
+    profiles = size_profiles(sizes)
+    print(f"Found sizes for {len(profiles)} customers")
+    if args.dry_run:
+        for profile in profiles[:10]:
+            print(f"  {profile['email']}: {profile['properties']}")
+        return
+
+    api_key = os.getenv('KLAVIYO_API_KEY')
+    if not api_key:
+        api_key = input("Enter your Klaviyo Private API Key: ").strip()
+    if not api_key:
+        print("❌ API key required. Get it from Klaviyo Settings → Account → API Keys")
+        return
+
+    klaviyo = KlaviyoAutomation(api_key)
+    jobs = klaviyo.bulk_import_profiles(profiles)
+    klaviyo.client.close()
+    completed = sum(job["attributes"].get("completed_count", 0) for job in jobs)
+    print(f"\n✅ Backfill complete: {completed} of {len(profiles)} profiles updated in {len(jobs)} import jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Klaviyo Email Template Build
+Assembles the email templates from shared partials, inlines CSS and minifies the HTML
+
+Sources live in email_src/:
+    templates.json      one entry per email: body, locales, tags, variables, campaign variants
+    layout.html         document shell, includes the header, the email body and the footer
+    partials/*.html     shared blocks (header, collections grid, footer)
+    emails/*.html       the body of each email
+    locales/<code>.json translated strings and shared settings per locale
+    styles.css          class rules inlined into style="" attributes
+
+Build syntax is [[ name ]] for variables, [[> partial ]] for includes and
+[[ for item in list ]]...[[ endfor ]] for loops, so Klaviyo's own {{ }} and
+{% %} tags pass through untouched. Compiled output is cached by a hash of every
+input it used, so rebuilding after a change only recompiles affected emails.
+
+Usage:
+    python3 build_templates.py            # build every template into dist/
+    python3 build_templates.py --force    # ignore the cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from html_to_text import html_to_text
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BASE_DIR, "email_src")
+DIST_DIR = os.path.join(BASE_DIR, "dist")
+CACHE_DIR = os.path.join(BASE_DIR, ".build-cache")
+# Bump when the compiler output changes so cached builds are discarded
+BUILD_VERSION = 1
+
+_VARIABLE_RE = re.compile(r"\[\[\s*([\w.]+)\s*\]\]")
+_INCLUDE_RE = re.compile(r"\[\[>\s*([\w-]+)\s*\]\]")
+_LOOP_RE = re.compile(r"\[\[\s*for\s+(\w+)\s+in\s+(\w+)\s*\]\](.*?)\[\[\s*endfor\s*\]\]", re.S)
+_CSS_RULE_RE = re.compile(r"([^{}]+){([^{}]*)}")
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_START_TAG_RE = re.compile(r"<([a-zA-Z][\w-]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>")
+_CLASS_ATTR_RE = re.compile(r"\s+class\s*=\s*(\"[^\"]*\"|'[^']*')")
+_STYLE_ATTR_RE = re.compile(r"\s+style\s*=\s*(\"[^\"]*\"|'[^']*')")
+_KLAVIYO_TAG_RE = re.compile(r"{{.*?}}|{%.*?%}", re.S)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_BLOCK_TAG_SPACE_RE = re.compile(
+    r"\s*(</?(?:html|head|body|meta|title|link|style|table|tbody|thead|tr|td|th|div|p|h[1-6]|ul|ol|li|br)\b"
+    r"(?:[^>\"']|\"[^\"]*\"|'[^']*')*>)\s*"
+)
+_SPACE_RE = re.compile(r"\s+")
+
+
+class BuildError(Exception):
+    pass
+
+
+class SourceTree:
+    """Reads email_src/ once per build and remembers which files each email used"""
+
+    def __init__(self, source_dir: str = SOURCE_DIR):
+        self.source_dir = source_dir
+        self.files: Dict[str, str] = {}
+
+    def read(self, relative_path: str) -> str:
+        if relative_path not in self.files:
+            path = os.path.join(self.source_dir, relative_path)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files[relative_path] = f.read()
+            except OSError:
+                raise BuildError(f"missing source file {relative_path}")
+        return self.files[relative_path]
+
+    def read_json(self, relative_path: str):
+        return json.loads(self.read(relative_path))
+
+
+def _lookup(variables: Dict, name: str):
+    value = variables
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise BuildError(f"undefined variable [[ {name} ]]")
+        value = value[part]
+    return value
+
+
+def render(text: str, variables: Dict, sources: SourceTree, used: set, content: str, depth: int = 0) -> str:
+    """Expand includes, loops and variables (variables may themselves use [[ ]])"""
+    if depth > 10:
+        raise BuildError("includes or variables nested too deeply (recursive?)")
+
+    def include(match):
+        name = match.group(1)
+        path = f"emails/{content}.html" if name == "content" else f"partials/{name}.html"
+        used.add(path)
+        return render(sources.read(path), variables, sources, used, content, depth + 1)
+
+    def loop(match):
+        item_name, list_name, body = match.groups()
+        return "".join(
+            render(body, dict(variables, **{item_name: item}), sources, used, content, depth + 1)
+            for item in _lookup(variables, list_name)
+        )
+
+    def variable(match):
+        value = _lookup(variables, match.group(1))
+        if isinstance(value, str) and "[[" in value:
+            value = render(value, variables, sources, used, content, depth + 1)
+        return str(value)
+
+    text = _INCLUDE_RE.sub(include, text)
+    text = _LOOP_RE.sub(loop, text)
+    return _VARIABLE_RE.sub(variable, text)
+
+
+def parse_styles(css: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Tag and class declarations from simple ``tag`` / ``.class`` rules"""
+    tags, classes = {}, {}
+    for selectors, body in _CSS_RULE_RE.findall(_CSS_COMMENT_RE.sub("", css)):
+        declarations = "; ".join(part.strip() for part in body.split(";") if part.strip())
+        for selector in selectors.split(","):
+            selector = selector.strip()
+            if re.fullmatch(r"\.[\w-]+", selector):
+                target = classes
+                selector = selector[1:]
+            elif re.fullmatch(r"[a-z][\w-]*", selector):
+                target = tags
+            else:
+                raise BuildError(f"unsupported selector {selector!r} in styles.css (use tag or .class)")
+            target[selector] = "; ".join(filter(None, [target.get(selector), declarations]))
+    return tags, classes
+
+
+def inline_css(html: str, tag_styles: Dict[str, str], class_styles: Dict[str, str]) -> str:
+    """Move stylesheet rules into style="" (tag rules, then classes, then the element's own style)"""
+
+    def inline(match):
+        tag, attrs = match.group(1), match.group(2)
+        styles = [tag_styles.get(tag.lower())]
+        class_match = _CLASS_ATTR_RE.search(attrs)
+        if class_match:
+            names = class_match.group(1)[1:-1].split()
+            unknown = [name for name in names if name not in class_styles]
+            if unknown:
+                raise BuildError(f"class {', '.join(unknown)} on <{tag}> has no rule in styles.css")
+            styles.extend(class_styles[name] for name in names)
+            attrs = _CLASS_ATTR_RE.sub("", attrs, count=1)
+        style_match = _STYLE_ATTR_RE.search(attrs)
+        if style_match:
+            styles.append(style_match.group(1)[1:-1].strip().rstrip(";"))
+            attrs = _STYLE_ATTR_RE.sub("", attrs, count=1)
+        style = "; ".join(filter(None, styles))
+        if not style:
+            return match.group(0)
+        closing = "/" if attrs.rstrip().endswith("/") else ""
+        attrs = attrs.rstrip().rstrip("/").rstrip()
+        return f'<{tag}{attrs} style="{style};"{closing}>'
+
+    return _START_TAG_RE.sub(inline, html)
+
+
+def minify_html(html: str) -> str:
+    """Drop comments and the whitespace around block tags; Klaviyo tags are left as written"""
+    tags = []
+
+    def protect(match):
+        tags.append(match.group())
+        return f"\x00{len(tags) - 1}\x00"
+
+    html = _KLAVIYO_TAG_RE.sub(protect, html)
+    html = _HTML_COMMENT_RE.sub("", html)
+    html = _SPACE_RE.sub(" ", html)
+    html = _BLOCK_TAG_SPACE_RE.sub(r"\1", html).strip()
+    return re.sub("\x00(\\d+)\x00", lambda match: tags[int(match.group(1))], html)
+
+
+def _build_variants(templates: Dict) -> List[Tuple[str, str, Optional[str], Dict]]:
+    """(template name, locale, variant, config) for every locale and campaign variant"""
+    builds = []
+    for base_name, config in templates.items():
+        for locale in config.get("locales", ["nb"]):
+            builds.append((f"{base_name}_{locale}", locale, None, config))
+            for variant in config.get("variants", {}):
+                builds.append((f"{base_name}_{variant}_{locale}", locale, variant, config))
+    return builds
+
+
+def _cache_key(sources: SourceTree, paths: List[str], config: Dict, locale: str, variant: Optional[str]) -> str:
+    digest = hashlib.sha256(f"{BUILD_VERSION}|{locale}|{variant}".encode("utf-8"))
+    digest.update(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    for path in sorted(paths):
+        digest.update(path.encode("utf-8"))
+        digest.update(sources.read(path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compile_template(sources: SourceTree, name: str, locale: str, variant: Optional[str], config: Dict) -> Dict:
+    """Render, inline and minify one email; returns its upload fields and the files it used"""
+    used = {"layout.html", "styles.css", f"locales/{locale}.json"}
+    variables = dict(sources.read_json(f"locales/{locale}.json"))
+    variables.update(config.get("vars", {}))
+    if variant:
+        variables.update(config["variants"][variant])
+
+    html = render(sources.read("layout.html"), variables, sources, used, config["email"])
+    html = minify_html(inline_css(html, *parse_styles(sources.read("styles.css"))))
+    subject = render(variables.get("subject", name), variables, sources, used, config["email"])
+    return {
+        "subject": subject,
+        "tags": config.get("tags", []),
+        "html": html,
+        "text": html_to_text(html),
+        "sources": sorted(used),
+    }
+
+
+def build_all(force: bool = False, source_dir: str = SOURCE_DIR, cache_dir: str = CACHE_DIR,
+              verbose: bool = False) -> Dict[str, Dict]:
+    """Build every template, reusing cached output whose inputs have not changed
+
+    Returns ``{name: {"subject", "tags", "html", "text"}}`` in the shape
+    upload_templates.get_templates() returns.
+    """
+    sources = SourceTree(source_dir)
+    templates = sources.read_json("templates.json")
+    os.makedirs(cache_dir, exist_ok=True)
+    built, compiled = {}, 0
+    for name, locale, variant, config in _build_variants(templates):
+        cache_file = os.path.join(cache_dir, f"{name}.json")
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        # The cache records which sources the last build read; re-hash those to validate it
+        if not force and cached:
+            try:
+                fresh = cached["key"] == _cache_key(sources, cached["sources"], config, locale, variant)
+            except BuildError:
+                fresh = False
+        else:
+            fresh = False
+        if not fresh:
+            result = compile_template(sources, name, locale, variant, config)
+            result["key"] = _cache_key(sources, result["sources"], config, locale, variant)
+            with open(cache_file, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            cached = result
+            compiled += 1
+            if verbose:
+                print(f"🔨 Built {name} ({len(result['html'])} bytes)")
+        built[name] = {key: cached[key] for key in ("subject", "tags", "html", "text")}
+        export = config.get("export", {}).get(locale) if not variant else None
+        if export:
+            _write_if_changed(os.path.join(os.path.dirname(source_dir), export), cached["html"] + "\n")
+    if verbose:
+        print(f"✅ {len(built)} templates, {compiled} compiled, {len(built) - compiled} from cache")
+    return built
+
+
+def _write_if_changed(path: str, content: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def write_dist(templates: Dict[str, Dict], dist_dir: str = DIST_DIR):
+    os.makedirs(dist_dir, exist_ok=True)
+    for name, template in templates.items():
+        _write_if_changed(os.path.join(dist_dir, f"{name}.html"), template["html"] + "\n")
+        _write_if_changed(os.path.join(dist_dir, f"{name}.txt"), template["text"] + "\n")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build the Klaviyo email templates from email_src/")
+    parser.add_argument("--force", action="store_true", help="Rebuild every template, ignoring the cache")
+    parser.add_argument("--dist", default=DIST_DIR, help="Where to write the built .html and .txt files")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    templates = build_all(force=args.force, verbose=True)
+    write_dist(templates, args.dist)
+    print(f"📦 Wrote {len(templates)} templates to {args.dist} in {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+HTML to plain text for the email templates
+Builds the text part Klaviyo sends to clients that don't render HTML
+"""
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional
+
+# Klaviyo template tags pass through untouched ({{ first_name|default:"venn" }}, {% unsubscribe_url %})
+KLAVIYO_TAG_RE = re.compile(r"{{.*?}}|{%.*?%}", re.S)
+_PLACEHOLDER = "\x00{}\x00"
+_PLACEHOLDER_RE = re.compile("\x00(\\d+)\x00")
+
+SKIP_TAGS = {"head", "style", "script", "title", "noscript"}
+BLOCK_TAGS = {"p", "div", "table", "tr", "ul", "ol", "li", "blockquote", "section", "header", "footer",
+              "h1", "h2", "h3", "h4", "h5", "h6", "hr"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+CELL_TAGS = {"td", "th"}
+_SPACE_RE = re.compile(r"[ \t\r\n\f\u00a0]+")
+
+
+class HtmlToText(HTMLParser):
+    """Single-pass HTML tokenizer that writes readable plain text
+
+    Blocks and table rows become lines, table cells on one row are joined
+    with spaces, links keep their target after the text, images keep their
+    alt text, and <head>/<style>/<script> content is dropped. Entities are
+    decoded by the parser itself.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self.line: List[str] = []
+        self.skip_depth = 0
+        self.links: List[Optional[str]] = []
+        self.link_text: List[str] = []
+
+    def _break(self, blank: bool = False):
+        text = "".join(self.line).strip()
+        self.line = []
+        if text:
+            self.lines.append(text)
+        if blank and self.lines and self.lines[-1] != "":
+            self.lines.append("")
+
+    def _write(self, text: str):
+        if self.links:
+            self.link_text.append(text)
+        if self.line and not self.line[-1].endswith(" ") and text.startswith(" "):
+            self.line.append(" ")
+            text = text.lstrip()
+        elif not self.line or self.line[-1].endswith(" "):
+            text = text.lstrip()
+        if text:
+            self.line.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        attrs = dict(attrs)
+        if tag == "br":
+            self._break()
+        elif tag in HEADING_TAGS or tag in ("p", "table", "hr"):
+            self._break(blank=True)
+        elif tag in BLOCK_TAGS:
+            self._break()
+            if tag == "li":
+                self.line.append("- ")
+        elif tag in CELL_TAGS:
+            self._write(" ")
+        elif tag == "a":
+            self.links.append(attrs.get("href"))
+            self.link_text = []
+        elif tag == "img" and attrs.get("alt"):
+            self._write(" " + attrs["alt"] + " ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if self.skip_depth:
+            return
+        if tag in HEADING_TAGS or tag in ("p", "table"):
+            self._break(blank=True)
+        elif tag in BLOCK_TAGS:
+            self._break()
+        elif tag in CELL_TAGS:
+            self._write(" ")
+        elif tag == "a" and self.links:
+            href = self.links.pop()
+            text = _SPACE_RE.sub(" ", "".join(self.link_text)).strip()
+            if href and not href.startswith(("#", "mailto:")) and href != text:
+                if self.line or not self.lines:
+                    self._write(f" ({href}) ")
+                else:
+                    # A link around whole blocks (a card): put the target after its last line
+                    last = next((i for i in range(len(self.lines) - 1, -1, -1) if self.lines[i]), None)
+                    if last is not None:
+                        self.lines[last] += f" ({href})"
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ("br", "img", "hr"):
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._write(_SPACE_RE.sub(" ", data))
+
+    def text(self) -> str:
+        self._break()
+        while self.lines and self.lines[-1] == "":
+            self.lines.pop()
+        return "\n".join(_SPACE_RE.sub(" ", line).rstrip() if line else line for line in self.lines)
+
+
+def html_to_text(html: str) -> str:
+    """Plain-text version of an email template, keeping Klaviyo tags verbatim"""
+    tags = []
+
+    def protect(match):
+        tags.append(match.group())
+        return _PLACEHOLDER.format(len(tags) - 1)
+
+    parser = HtmlToText()
+    parser.feed(KLAVIYO_TAG_RE.sub(protect, html))
+    parser.close()
+    return _PLACEHOLDER_RE.sub(lambda match: tags[int(match.group(1))], parser.text())
+
+
+def convert_files(paths: Iterable[str], output_dir: Optional[str] = None, workers: Optional[int] = None) -> List[str]:
+    """Convert many HTML files in parallel; writes <name>.txt next to each file or into ``output_dir``"""
+    paths = list(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        texts = list(pool.map(_convert_file, paths, chunksize=16))
+    written = []
+    for path, text in zip(paths, texts):
+        target_dir = output_dir or os.path.dirname(path)
+        os.makedirs(target_dir or ".", exist_ok=True)
+        target = os.path.join(target_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        written.append(target)
+    return written
+
+
+def _convert_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return html_to_text(f.read())
+
+
+def _regex_to_text(html_content: str) -> str:
+    # The previous single-regex conversion, kept as the benchmark baseline
+    text = re.sub('<[^<]+?>', '', html_content)
+    text = text.replace('&nbsp;', ' ')
+    return text.strip()
+
+
+def benchmark(path: str, iterations: int):
+    with open(path, "r", encoding="utf-8") as f:
+        html = f.read()
+    for name, func in (("regex (old)", _regex_to_text), ("HtmlToText", html_to_text)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            text = func(html)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>12}: {elapsed / iterations * 1000:.3f} ms per template, "
+              f"{len(html) * iterations / elapsed / 1e6:.1f} MB/s, {len(text)} chars of text")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Convert email templates to plain text")
+    parser.add_argument("files", nargs="*", help="HTML files to convert (printed when only one is given)")
+    parser.add_argument("--out-dir", help="Write <name>.txt files here instead of next to the inputs")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for batch conversion")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="Time N conversions of each file against the old regex conversion")
+    args = parser.parse_args(argv)
+
+    files = args.files or [os.path.join(os.path.dirname(os.path.abspath(__file__)), "kulkid_template_final.html")]
+    if args.benchmark:
+        for path in files:
+            print(f"📊 {path}")
+            benchmark(path, args.benchmark)
+        return
+    if len(files) == 1 and not args.out_dir:
+        print(_convert_file(files[0]))
+        return
+    started = time.perf_counter()
+    written = convert_files(files, args.out_dir, args.workers)
+    print(f"✅ Converted {len(written)} templates in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
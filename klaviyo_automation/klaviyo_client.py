@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Shared Klaviyo API client
+One pooled HTTPS session, Klaviyo rate limits and bounded concurrency for the upload scripts
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://a.klaviyo.com/api"
+API_REVISION = "2024-10-15"
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+# Seconds per request unless the caller passes its own ``timeout``
+REQUEST_TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimit:
+    """Klaviyo's per-endpoint quota: a burst (per second) and a steady (per minute) window
+
+    ``acquire`` blocks until a request fits in both windows. Shared between threads.
+    """
+
+    def __init__(self, burst_per_second: int, steady_per_minute: int):
+        self.windows = [(1.0, burst_per_second, deque()), (60.0, steady_per_minute, deque())]
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = 0.0
+                for period, limit, sent in self.windows:
+                    while sent and now - sent[0] >= period:
+                        sent.popleft()
+                    if len(sent) >= limit:
+                        wait = max(wait, period - (now - sent[0]))
+                if wait <= 0:
+                    for _, _, sent in self.windows:
+                        sent.append(now)
+                    return
+            time.sleep(wait)
+
+
+# Published quotas for the endpoints the scripts use (burst/s, steady/min)
+RATE_LIMITS = {
+    "templates": RateLimit(10, 150),
+    "profiles": RateLimit(75, 700),
+    "profile-bulk-import-jobs": RateLimit(10, 150),
+}
+DEFAULT_RATE_LIMIT = RateLimit(3, 60)
+
+
+class KlaviyoClient:
+    """Session-backed Klaviyo API client
+
+    Connections are pooled (one TLS handshake per worker instead of per call),
+    each request waits for its endpoint's rate limit, and 429/5xx responses are
+    retried after ``Retry-After`` (or an exponential backoff).
+    """
+
+    def __init__(self, api_key: str, max_workers: int = MAX_WORKERS, max_retries: int = MAX_RETRIES,
+                 timeout: float = REQUEST_TIMEOUT):
+        self.base_url = API_URL
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Klaviyo-API-Key {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "revision": API_REVISION
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+
+    def _rate_limit(self, url: str) -> RateLimit:
+        endpoint = url[len(self.base_url):].split("?")[0].strip("/").split("/")[0]
+        return RATE_LIMITS.get(endpoint, DEFAULT_RATE_LIMIT)
+
+    def _retry_delay(self, response: Optional[requests.Response], attempt: int) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return max(float(retry_after), 0.0)
+                except ValueError:
+                    pass
+        return min(2 ** attempt, 30)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send one API request, honouring rate limits and retrying throttled or failed calls"""
+        url = path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+        limit = self._rate_limit(url)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            limit.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(None, attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(response, attempt))
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def map(self, func: Callable, items: Iterable) -> List:
+        """Run ``func`` over ``items`` on at most ``max_workers`` threads, results in input order"""
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def paginate(self, path: str, **kwargs) -> List[Dict]:
+        """Every ``data`` item of a list endpoint, following ``links.next``"""
+        items = []
+        url = path
+        while url:
+            response = self.get(url, **kwargs)
+            response.raise_for_status()
+            body = response.json()
+            items.extend(body.get("data", []))
+            url = (body.get("links") or {}).get("next")
+            # The next link already carries the filters and page cursor
+            kwargs.pop("params", None)
+        return items
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
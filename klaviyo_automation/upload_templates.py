@@ -4,21 +4,31 @@ Klaviyo Template Upload Automation
 Uploads all Norwegian email templates via Klaviyo API
 """
 
-import requests
+import argparse
+import hashlib
 import json
 import os
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional
+
+from build_templates import build_all
+from html_to_text import html_to_text
+from klaviyo_client import KlaviyoClient
+
+MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".template-manifest.json")
+# Klaviyo accepts up to 10,000 profiles (and 5 MB) per bulk import job
+BULK_IMPORT_MAX_PROFILES = 10000
+BULK_IMPORT_MAX_BYTES = 4_500_000
+BULK_IMPORT_POLL_SECONDS = 2
+PROPERTY_INIT_EMAIL = "property-init@kulkid.no"
 
 class KlaviyoAutomation:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_workers: int = 8):
         self.api_key = api_key
-        self.base_url = "https://a.klaviyo.com/api"
-        self.headers = {
-            "Authorization": f"Klaviyo-API-Key {api_key}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "revision": "2024-10-15"
-        }
+        # One pooled, rate-limited session shared by every call (and worker thread)
+        self.client = KlaviyoClient(api_key, max_workers=max_workers)
+        self.base_url = self.client.base_url
+        self.headers = dict(self.client.session.headers)
     
     def create_template(self, name: str, subject: str, html_content: str, tags: List[str] = None) -> Dict:
         """Create email template in Klaviyo"""
@@ -35,11 +45,7 @@ class KlaviyoAutomation:
             }
         }
             
-        response = requests.post(
-            f"{self.base_url}/templates/",
-            headers=self.headers,
-            json=data
-        )
+        response = self.client.post("templates/", json=data)
         
         if response.status_code in [200, 201]:
             print(f"✅ Template '{name}' created successfully!")
@@ -48,47 +54,146 @@ class KlaviyoAutomation:
             print(f"❌ Error creating template '{name}': {response.text}")
             return None
     
+    def update_template(self, template_id: str, name: str, html_content: str) -> Dict:
+        """Replace the name, HTML and text of an existing template"""
+        data = {
+            "data": {
+                "type": "template",
+                "id": template_id,
+                "attributes": {
+                    "name": name,
+                    "html": html_content,
+                    "text": self._html_to_text(html_content)
+                }
+            }
+        }
+
+        response = self.client.patch(f"templates/{template_id}/", json=data)
+
+        if response.status_code == 200:
+            print(f"🔄 Template '{name}' updated")
+            return response.json()
+        else:
+            print(f"❌ Error updating template '{name}': {response.text}")
+            return None
+
+    def list_templates(self) -> Dict[str, str]:
+        """Map template name -> id for every template in the account (one paginated listing)"""
+        templates = self.client.paginate("templates/", params={"fields[template]": "name"})
+        return {template["attributes"]["name"]: template["id"] for template in templates}
+
+    def sync_templates(self, templates: Dict[str, Dict], manifest_file: str = MANIFEST_FILE) -> Dict[str, int]:
+        """Create or update only the templates whose content changed since the last sync
+
+        The manifest stores a hash of each template's name, HTML and text along
+        with its Klaviyo id. Templates missing from the account are created,
+        templates whose hash differs (or that the manifest has never seen) are
+        PATCHed, and the rest are skipped without any API call.
+        """
+        manifest = _load_manifest(manifest_file)
+        existing = self.list_templates()
+        counts = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
+
+        def sync_one(item):
+            name, template = item
+            digest = template_hash(name, template)
+            template_id = existing.get(name)
+            if template_id and manifest.get(name) == {"id": template_id, "hash": digest}:
+                return name, "skipped", template_id, digest
+            if template_id:
+                result = self.update_template(template_id, name, template["html"])
+                return name, "updated" if result else "failed", template_id, digest
+            result = self.create_template(name, template["subject"], template["html"], template.get("tags", []))
+            return name, "created" if result else "failed", result and result["data"]["id"], digest
+
+        for name, outcome, template_id, digest in self.client.map(sync_one, templates.items()):
+            counts[outcome] += 1
+            if outcome != "failed":
+                manifest[name] = {"id": template_id, "hash": digest}
+        _save_manifest(manifest_file, manifest)
+        return counts
+
     def _html_to_text(self, html_content: str) -> str:
         """Convert HTML to plain text for email clients that don't support HTML"""
-        # Simple text conversion - removes HTML tags
-        import re
-        text = re.sub('<[^<]+?>', '', html_content)
-        text = text.replace('&nbsp;', ' ')
-        return text.strip()
+        return html_to_text(html_content)
     
-    def create_custom_property(self, name: str, property_type: str, description: str = "") -> Dict:
-        """Create custom customer property using profile update"""
-        # Klaviyo automatically creates properties when they're first used
-        # We'll create a test profile with these properties to initialize them
-        
-        test_data = {
+    def create_templates(self, templates: Dict[str, Dict]) -> List[Dict]:
+        """Create many templates concurrently (bounded by the client's worker pool)"""
+        return self.client.map(
+            lambda item: self.create_template(
+                name=item[0],
+                subject=item[1]["subject"],
+                html_content=item[1]["html"],
+                tags=item[1].get("tags", [])
+            ),
+            templates.items()
+        )
+
+    def bulk_import_profiles(self, profiles: List[Dict], wait: bool = True) -> List[Dict]:
+        """Create or update profiles through Klaviyo bulk import jobs
+
+        ``profiles`` are profile attribute dicts (``email`` plus ``properties``).
+        They are split into jobs of at most 10,000 profiles / ~5 MB, submitted
+        concurrently, and (with ``wait``) polled until each job finishes.
+        Returns the final job resources.
+        """
+        jobs = self.client.map(self._submit_import_job, _import_batches(profiles))
+        jobs = [job for job in jobs if job]
+        if wait:
+            jobs = self.client.map(self._wait_for_import_job, jobs)
+        return jobs
+
+    def _submit_import_job(self, batch: List[Dict]) -> Dict:
+        data = {
             "data": {
-                "type": "profile",
+                "type": "profile-bulk-import-job",
                 "attributes": {
-                    "email": f"test_{name}@kulkid.no",
-                    "properties": {
-                        name: self._get_default_value(property_type)
+                    "profiles": {
+                        "data": [{"type": "profile", "attributes": profile} for profile in batch]
                     }
                 }
             }
         }
-        
-        response = requests.post(
-            f"{self.base_url}/profiles/",
-            headers=self.headers,
-            json=test_data
-        )
-        
-        if response.status_code in [200, 201]:
-            print(f"✅ Custom property '{name}' initialized successfully!")
-            # Clean up test profile
-            self._cleanup_test_profile(f"test_{name}@kulkid.no")
-            return response.json()
+        response = self.client.post("profile-bulk-import-jobs/", json=data)
+        if response.status_code in [200, 201, 202]:
+            job = response.json()["data"]
+            print(f"📦 Import job {job['id']} queued with {len(batch)} profiles")
+            return job
+        print(f"❌ Error queuing import of {len(batch)} profiles: {response.text}")
+        return None
+
+    def _wait_for_import_job(self, job: Dict) -> Dict:
+        while job["attributes"].get("status") not in ("complete", "cancelled", "failed"):
+            time.sleep(BULK_IMPORT_POLL_SECONDS)
+            response = self.client.get(f"profile-bulk-import-jobs/{job['id']}/")
+            response.raise_for_status()
+            job = response.json()["data"]
+        attributes = job["attributes"]
+        print(f"{'✅' if attributes['status'] == 'complete' else '❌'} Import job {job['id']} {attributes['status']}: "
+              f"{attributes.get('completed_count', 0)} of {attributes.get('total_count', 0)} profiles, "
+              f"{attributes.get('failed_count', 0)} failed")
+        return job
+
+    def initialize_custom_properties(self, properties: List[Dict]) -> bool:
+        """Initialize every custom property with one import job
+
+        A single placeholder profile carries a default value for each property,
+        so Klaviyo registers them all at once; if the job imported it, the
+        placeholder is then queued for deletion.
+        """
+        profile = {
+            "email": PROPERTY_INIT_EMAIL,
+            "properties": {prop["name"]: self._get_default_value(prop["type"]) for prop in properties}
+        }
+        jobs = self.bulk_import_profiles([profile])
+        ok = bool(jobs) and all(job["attributes"]["status"] == "complete" for job in jobs)
+        if ok:
+            print(f"✅ Initialized {len(properties)} custom properties: {', '.join(profile['properties'])}")
+            self._delete_imported_profiles(jobs)
         else:
-            print(f"⚠️  Property '{name}' setup - will be created on first use")
-            print(f"   Description: {description}")
-            return None
-    
+            print("⚠️  Property setup incomplete - properties will be created on first use")
+        return ok
+
     def _get_default_value(self, property_type: str):
         """Get default value for property type"""
         if property_type.lower() == "datetime":
@@ -96,142 +201,79 @@ class KlaviyoAutomation:
         else:
             return "default_value"
     
-    def _cleanup_test_profile(self, email: str):
-        """Clean up test profile after property creation"""
+    def _delete_imported_profiles(self, jobs: List[Dict]):
+        """Request deletion of the profiles the given import jobs wrote
+
+        The profiles come from each job's ``profiles`` relationship, so only a
+        profile the import actually created or updated is removed. Klaviyo has
+        no DELETE on profiles; removal goes through a data privacy deletion job.
+        """
         try:
-            # Get profile ID
-            response = requests.get(
-                f"{self.base_url}/profiles/?filter=equals(email,\"{email}\")",
-                headers=self.headers
-            )
-            if response.status_code == 200:
-                profiles = response.json().get('data', [])
-                if profiles:
-                    profile_id = profiles[0]['id']
-                    # Delete test profile
-                    requests.delete(
-                        f"{self.base_url}/profiles/{profile_id}/",
-                        headers=self.headers
-                    )
-                    print(f"🧹 Cleaned up test profile for {email}")
+            for job in jobs:
+                response = self.client.get(f"profile-bulk-import-jobs/{job['id']}/profiles/")
+                response.raise_for_status()
+                for profile in response.json().get("data", []):
+                    data = {
+                        "data": {
+                            "type": "data-privacy-deletion-job",
+                            "attributes": {"profile": {"data": {"type": "profile", "id": profile["id"]}}}
+                        }
+                    }
+                    response = self.client.post("data-privacy-deletion-jobs/", json=data)
+                    response.raise_for_status()
+                    print(f"🧹 Deletion requested for placeholder profile {profile['id']}")
         except Exception as e:
-            print(f"Note: Test profile cleanup skipped ({str(e)})")
-
-# Email Templates Dictionary
-TEMPLATES = {
-    "kulkid_welcome_nb": {
-        "subject": "Velkommen til Kul Kid-klubben! 🎉 Her er din 15% rabatt",
-        "tags": ["norwegian", "welcome", "discount"],
-        "html": """<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Velkommen til Kul Kid!</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: Arial, sans-serif; background-color: #f8f9fa;">
-    <table width="100%" cellspacing="0" cellpadding="0" border="0" style="background-color: #f8f9fa;">
-        <tr>
-            <td align="center">
-                <table width="600" cellspacing="0" cellpadding="0" border="0" style="background-color: #ffffff; margin: 20px 0;">
-                    <!-- Header -->
-                    <tr>
-                        <td align="center" style="padding: 40px 20px 20px; background-color: #ffffff;">
-                            <h1 style="color: #2c3e50; font-size: 28px; margin: 0; font-weight: bold;">
-                                Velkommen til Kul Kid-klubben, {{ first_name|default:"venn" }}! 🌟
-                            </h1>
-                        </td>
-                    </tr>
-                    <!-- Main Content -->
-                    <tr>
-                        <td style="padding: 0 40px 20px;">
-                            <p style="font-size: 16px; line-height: 1.6; color: #555; margin-bottom: 20px;">
-                                Tusen takk for at du ble med i Kul Kid-klubben!
-                            </p>
-                            <!-- Discount Code -->
-                            <div style="background-color: #e8f5e8; border: 2px dashed #27ae60; padding: 20px; text-align: center; margin: 20px 0; border-radius: 8px;">
-                                <p style="margin: 0; font-size: 14px; color: #555;">Din personlige rabattkode:</p>
-                                <h2 style="color: #27ae60; font-size: 24px; margin: 10px 0; font-weight: bold; letter-spacing: 2px;">
-                                    KULKID15
-                                </h2>
-                                <p style="margin: 0; font-size: 14px; color: #555;">
-                                    Gyldig i 7 dager
-                                </p>
-                            </div>
-                            <p style="font-size: 16px; line-height: 1.6; color: #555; margin-bottom: 20px;">
-                                Vi ser frem til å hjelpe deg finne de perfekte klærne! Start gjerne med å se våre mest populære kolleksjoner:
-                            </p>
-                        </td>
-                    </tr>
-                    <!-- Collections -->
-                    <tr>
-                        <td style="padding: 0 40px;">
-                            <table width="100%" cellspacing="0" cellpadding="10">
-                                <tr>
-                                    <td style="width: 33.33%; text-align: center; padding: 10px;">
-                                        <a href="https://kulkid.no/collections/basics" style="text-decoration: none; color: #2c3e50;">
-                                            <div style="border: 2px solid #ecf0f1; padding: 15px; border-radius: 8px; background-color: #f8f9fa;">
-                                                <h3 style="margin: 0; font-size: 16px; font-weight: bold;">BASICS</h3>
-                                                <p style="margin: 5px 0 0; font-size: 12px; color: #7f8c8d;">Tidløse favoritter</p>
-                                            </div>
-                                        </a>
-                                    </td>
-                                    <td style="width: 33.33%; text-align: center; padding: 10px;">
-                                        <a href="https://kulkid.no/collections/superhelter" style="text-decoration: none; color: #2c3e50;">
-                                            <div style="border: 2px solid #ecf0f1; padding: 15px; border-radius: 8px; background-color: #f8f9fa;">
-                                                <h3 style="margin: 0; font-size: 16px; font-weight: bold;">SUPERHELTER</h3>
-                                                <p style="margin: 5px 0 0; font-size: 12px; color: #7f8c8d;">For de tøffeste</p>
-                                            </div>
-                                        </a>
-                                    </td>
-                                    <td style="width: 33.33%; text-align: center; padding: 10px;">
-                                        <a href="https://kulkid.no/collections/gymtime" style="text-decoration: none; color: #2c3e50;">
-                                            <div style="border: 2px solid #ecf0f1; padding: 15px; border-radius: 8px; background-color: #f8f9fa;">
-                                                <h3 style="margin: 0; font-size: 16px; font-weight: bold;">GYMTIME</h3>
-                                                <p style="margin: 5px 0 0; font-size: 12px; color: #7f8c8d;">Komfort i hverdagen</p>
-                                            </div>
-                                        </a>
-                                    </td>
-                                </tr>
-                            </table>
-                        </td>
-                    </tr>
-                    <!-- CTA Button -->
-                    <tr>
-                        <td align="center" style="padding: 30px 40px;">
-                            <a href="https://kulkid.no" style="background-color: #27ae60; color: #ffffff; padding: 15px 30px; text-decoration: none; border-radius: 25px; font-weight: bold; font-size: 16px; display: inline-block;">
-                                Kul shopping! 👕✨
-                            </a>
-                        </td>
-                    </tr>
-                    <!-- Social Media -->
-                    <tr>
-                        <td align="center" style="padding: 20px 40px 40px; border-top: 1px solid #ecf0f1;">
-                            <p style="font-size: 14px; color: #7f8c8d; margin-bottom: 15px;">
-                                P.S. Følg oss på Instagram for daglig inspirasjon!
-                            </p>
-                            <a href="https://instagram.com/kulkid.no" style="background-color: #e1306c; color: white; padding: 10px 20px; text-decoration: none; border-radius: 20px; font-size: 14px;">
-                                @kulkid.no
-                            </a>
-                        </td>
-                    </tr>
-                    <!-- Footer -->
-                    <tr>
-                        <td style="background-color: #f8f9fa; padding: 20px; text-align: center;">
-                            <p style="font-size: 12px; color: #95a5a6; margin: 0;">
-                                Teamet på kulkid.no<br>
-                                <a href="{% unsubscribe_url %}" style="color: #95a5a6;">Avmeld deg her</a>
-                            </p>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>"""
-    }
-}
+            print(f"Note: Placeholder profile cleanup skipped ({str(e)})")
+
+# Email templates, built from the partials in email_src/ on first use (see build_templates.py)
+_templates = None
+
+
+def get_templates() -> Dict[str, Dict]:
+    """The built templates; importing this module (backfill_sizes.py does) builds nothing"""
+    global _templates
+    if _templates is None:
+        _templates = build_all()
+    return _templates
+
+
+def template_hash(name: str, template: Dict) -> str:
+    """Content hash of the fields a Klaviyo template stores (name, HTML, text)
+
+    The subject is not one of them: it belongs to the flow email or campaign
+    message that uses the template, so editing it does not change the hash.
+    """
+    content = json.dumps([name, template["html"], html_to_text(template["html"])], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _load_manifest(manifest_file: str) -> Dict[str, Dict]:
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest_file: str, manifest: Dict[str, Dict]):
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def _import_batches(profiles: List[Dict]) -> List[List[Dict]]:
+    """Split profiles into batches within the bulk import job limits"""
+    batches, batch, batch_bytes = [], [], 0
+    for profile in profiles:
+        size = len(json.dumps(profile, ensure_ascii=False).encode("utf-8")) + 32
+        if batch and (len(batch) >= BULK_IMPORT_MAX_PROFILES or batch_bytes + size > BULK_IMPORT_MAX_BYTES):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(profile)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
 
 # Customer Properties to Create
 CUSTOM_PROPERTIES = [
@@ -257,7 +299,14 @@ CUSTOM_PROPERTIES = [
     }
 ]
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Upload the Norwegian Klaviyo templates and properties")
+    parser.add_argument("--sync", action="store_true",
+                        help="Only create or update templates whose content changed (no duplicates)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE,
+                        help="Local manifest of uploaded template hashes used by --sync")
+    args = parser.parse_args(argv)
+
     print("🚀 Klaviyo Automation Setup Starting...")
     
     # Get API key from environment or user input
@@ -271,24 +320,22 @@ def main():
     
     klaviyo = KlaviyoAutomation(api_key)
     
+    if args.sync:
+        print("\n🔁 Syncing Norwegian email templates...")
+        counts = klaviyo.sync_templates(get_templates(), args.manifest)
+        klaviyo.client.close()
+        print(f"\n✅ Sync complete: {counts['created']} created, {counts['updated']} updated, "
+              f"{counts['skipped']} unchanged (skipped), {counts['failed']} failed")
+        return
+
     # Create custom properties
     print("\n📊 Creating custom customer properties...")
-    for prop in CUSTOM_PROPERTIES:
-        klaviyo.create_custom_property(
-            prop["name"], 
-            prop["type"], 
-            prop["description"]
-        )
+    klaviyo.initialize_custom_properties(CUSTOM_PROPERTIES)
     
     # Create email templates  
     print("\n📧 Creating Norwegian email templates...")
-    for template_name, template_data in TEMPLATES.items():
-        klaviyo.create_template(
-            name=template_name,
-            subject=template_data["subject"],
-            html_content=template_data["html"],
-            tags=template_data.get("tags", [])
-        )
+    klaviyo.create_templates(get_templates())
+    klaviyo.client.close()
     
     print("\n✅ Klaviyo automation setup complete!")
     print("\nNext steps:")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Offline asset budget benchmark for the Shopify theme
+
+For every JSON template the render graph (theme_graph.py) gives the files it
+renders; from those this script measures the stylesheets, scripts, images and
+fonts the page requests (raw and gzip bytes), plus the render-blocking
+resources in the <head> of the template's layout. Results are checked against
+scripts/asset-budgets.json and against the committed baseline in
+scripts/asset-budget-baseline.json, so weight creep fails the command on any
+clone (or in CI) before the theme is pushed. Each run is also appended to a
+local history in build/.
+
+The budgets are fixed ceilings set by the policy recorded in the budget file
+("_policy", with a reason per metric under "_reasons"); they are not moved to
+today's numbers. Growth from one commit to the next is the baseline's job.
+
+Usage:
+    python scripts/asset-budget.py                    # measure, record, check budgets and baseline
+    python scripts/asset-budget.py --no-record        # check without touching the history
+    python scripts/asset-budget.py --tolerance 0      # fail on any growth over the baseline
+    python scripts/asset-budget.py --update-baseline  # accept the current weights (commit the file)
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from theme_graph import iter_json_templates, linked_assets, read_text, template_closure, template_name
+
+BUDGET_FILE = 'scripts/asset-budgets.json'
+# Tracked, so every checkout compares against the same accepted weights
+BASELINE_FILE = 'scripts/asset-budget-baseline.json'
+HISTORY_FILE = 'build/asset-budget-history.json'
+# Growth allowed over the baseline before it counts as a regression (percent)
+TOLERANCE_DEFAULT = 1.0
+METRICS = [
+    'css_bytes', 'css_gzip_bytes', 'js_bytes', 'js_gzip_bytes',
+    'image_bytes', 'font_bytes', 'font_requests', 'requests', 'render_blocking',
+]
+
+_IMAGE_EXTENSIONS = r'gif|png|jpe?g|webp|avif|svg'
+_FONT_EXTENSIONS = r'woff2?|ttf|otf|eot'
+_LIQUID_ASSET_RE = re.compile(r'[\'"]([\w.-]+\.(?:%s|%s))[\'"]\s*\|\s*asset_url' % (_IMAGE_EXTENSIONS, _FONT_EXTENSIONS))
+_CSS_URL_RE = re.compile(r'url\(\s*[\'"]?(?:\./)?([\w.-]+\.(?:%s|%s))[\'"]?\s*\)' % (_IMAGE_EXTENSIONS, _FONT_EXTENSIONS))
+_FONT_FILE_RE = re.compile(r'\.(?:%s)$' % _FONT_EXTENSIONS)
+# Fonts fetched from outside assets/: Google Fonts stylesheets and files, Shopify font_url/font_face
+_EXTERNAL_FONT_RE = re.compile(
+    r'https://fonts\.(?:googleapis|gstatic)\.com/[^\s"\'>]+|\|\s*font_url\b|\|\s*font_face\b'
+)
+_COMMENT_RE = re.compile(r'{%-?\s*comment\s*-?%}.*?{%-?\s*endcomment\s*-?%}|<!--.*?-->', re.S)
+_NOSCRIPT_RE = re.compile(r'<noscript\b.*?</noscript>', re.S | re.I)
+_LINK_TAG_RE = re.compile(r'<link\b[^>]*>', re.S | re.I)
+_SCRIPT_TAG_RE = re.compile(r'<script\b([^>]*)>(.*?)</script>', re.S | re.I)
+_STYLESHEET_FILTER_RE = re.compile(r'\|\s*stylesheet_tag\b')
+_SCRIPT_FILTER_RE = re.compile(r'\|\s*script_tag\b')
+
+
+def gzip_size(data):
+    return len(gzip.compress(data, compresslevel=9, mtime=0))
+
+
+def _asset_weight(paths):
+    raw = b''.join(open(path, 'rb').read() for path in paths)
+    return len(raw), gzip_size(raw) if raw else 0
+
+
+def referenced_media(files, stylesheets):
+    """Images and font files in assets/ used by the given Liquid files and stylesheets"""
+    names = []
+    for path in files:
+        if path.endswith('.liquid'):
+            names.extend(_LIQUID_ASSET_RE.findall(read_text(path)))
+    for sheet in stylesheets:
+        names.extend(_CSS_URL_RE.findall(read_text(sheet)))
+    media = []
+    for name in names:
+        path = os.path.join('assets', name)
+        if path not in media and os.path.exists(path):
+            media.append(path)
+    return media
+
+
+def render_blocking(layout_file):
+    """Stylesheets and scripts in the layout's <head> that block first render
+
+    A stylesheet blocks unless it is print-only (the media="print" onload swap)
+    or only a preload; a script with a src blocks unless it is async, defer or a
+    module. Inline scripts block parsing too, so their bytes are reported.
+    Commented-out markup and <noscript> fallbacks are ignored.
+    """
+    content = read_text(layout_file)
+    head = content.split('</head>', 1)[0]
+    head = _NOSCRIPT_RE.sub('', _COMMENT_RE.sub('', head))
+    resources = []
+    for tag in _LINK_TAG_RE.findall(head):
+        attrs = tag.lower()
+        if not re.search(r'(?<![.\w])rel\s*=\s*["\']?stylesheet', attrs):
+            continue
+        if re.search(r'media\s*=\s*["\']print', attrs):
+            continue
+        resources.append(' '.join(tag.split()))
+    for line in head.splitlines():
+        if _STYLESHEET_FILTER_RE.search(line) or _SCRIPT_FILTER_RE.search(line):
+            resources.append(line.strip())
+    inline_bytes = 0
+    for attrs, body in _SCRIPT_TAG_RE.findall(head):
+        attrs = attrs.lower()
+        if 'src=' not in attrs:
+            inline_bytes += len(body.encode('utf-8'))
+        elif not re.search(r'\b(?:async|defer)\b|type\s*=\s*["\']module', attrs):
+            resources.append(f"<script{' '.join(attrs.split())}>")
+    return {'resources': resources, 'inline_script_bytes': inline_bytes}
+
+
+def measure_template(template_file):
+    files = template_closure(template_file)
+    stylesheets = linked_assets(files, '.css')
+    scripts = linked_assets(files, '.js')
+    media = referenced_media(files, stylesheets)
+    fonts = [path for path in media if _FONT_FILE_RE.search(path)]
+    images = [path for path in media if path not in fonts]
+    external_fonts = set()
+    for path in files:
+        if path.endswith('.liquid'):
+            external_fonts.update(_EXTERNAL_FONT_RE.findall(_COMMENT_RE.sub('', read_text(path))))
+    layouts = [path for path in files if path.startswith('layout' + os.sep)]
+    blocking = render_blocking(layouts[0]) if layouts else {'resources': [], 'inline_script_bytes': 0}
+
+    css_bytes, css_gzip = _asset_weight(stylesheets)
+    js_bytes, js_gzip = _asset_weight(scripts)
+    return {
+        'template': template_name(template_file),
+        'layout': layouts[0] if layouts else None,
+        'css_bytes': css_bytes,
+        'css_gzip_bytes': css_gzip,
+        'js_bytes': js_bytes,
+        'js_gzip_bytes': js_gzip,
+        'image_bytes': sum(os.path.getsize(path) for path in images),
+        'font_bytes': sum(os.path.getsize(path) for path in fonts),
+        'font_requests': len(fonts) + len(external_fonts),
+        'requests': len(stylesheets) + len(scripts) + len(media) + len(external_fonts),
+        'render_blocking': len(blocking['resources']),
+        'inline_head_script_bytes': blocking['inline_script_bytes'],
+        'stylesheets': stylesheets,
+        'scripts': scripts,
+        'images': images,
+        'render_blocking_resources': blocking['resources'],
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def check_budgets(results, budgets):
+    """Metrics over their budget; per-template limits override the defaults"""
+    failures = []
+    for result in results:
+        limits = dict(budgets.get('default', {}), **budgets.get('templates', {}).get(result['template'], {}))
+        for metric, limit in sorted(limits.items()):
+            if result.get(metric, 0) > limit:
+                failures.append(f"{result['template']}: {metric} {result[metric]} > budget {limit}")
+    return failures
+
+
+def baseline_entry(results):
+    """The tracked subset of a run: per-template metrics, no file lists"""
+    return [{key: result[key] for key in ['template'] + METRICS + ['inline_head_script_bytes']}
+            for result in results]
+
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+
+
+def check_regressions(results, previous, tolerance):
+    """Metrics that grew more than ``tolerance`` percent over the baseline run"""
+    before = {result['template']: result for result in previous.get('templates', [])}
+    failures = []
+    for result in results:
+        old = before.get(result['template'])
+        if not old:
+            continue
+        for metric in METRICS:
+            if metric in old and result[metric] > old[metric] * (1 + tolerance / 100):
+                failures.append(f"{result['template']}: {metric} {old[metric]} -> {result[metric]} "
+                                f"(+{result[metric] - old[metric]})")
+    return failures
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure per-template asset weight and fail on budget regressions.')
+    parser.add_argument('--budgets', default=BUDGET_FILE,
+                        help='JSON file with default and per-template metric budgets')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='Tracked JSON baseline the run must not grow past')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Write this run as the new baseline (after an intended weight change)')
+    parser.add_argument('--history', default=HISTORY_FILE,
+                        help='Local JSON log of previous runs')
+    parser.add_argument('--no-record', action='store_true',
+                        help='Do not append this run to the history')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_DEFAULT,
+                        help='Percent growth over the baseline allowed per metric')
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    started = time.perf_counter()
+    results = [measure_template(template_file) for template_file in iter_json_templates()]
+    elapsed = time.perf_counter() - started
+
+    for result in results:
+        print(f"  {result['template']}: css {result['css_bytes']} ({result['css_gzip_bytes']} gzip), "
+              f"js {result['js_bytes']} ({result['js_gzip_bytes']} gzip), images {result['image_bytes']}, "
+              f"fonts {result['font_requests']} requests, {result['requests']} requests, "
+              f"{result['render_blocking']} render-blocking")
+    print(f"Measured {len(results)} templates in {elapsed:.2f}s")
+
+    baseline = load_json(args.baseline, None)
+    if baseline is None and not args.update_baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline and commit it to catch growth")
+    failures = check_budgets(results, load_json(args.budgets, {}))
+    regressions = [] if args.update_baseline else check_regressions(results, baseline or {}, args.tolerance)
+
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': _git_revision(),
+        'passed': not (failures or regressions),
+        'templates': baseline_entry(results),
+    }
+    if not args.no_record:
+        history = load_json(args.history, {'runs': []})
+        history['runs'].append(run)
+        write_json(args.history, history)
+        print(f"History written to {args.history} ({len(history['runs'])} runs)")
+    if args.update_baseline:
+        write_json(args.baseline, {'revision': run['revision'], 'templates': run['templates']})
+        print(f"Baseline written to {args.baseline}")
+
+    for kind, items in (('Over budget', failures), ('Regressed over baseline', regressions)):
+        if items:
+            print(f"{kind}:")
+            for item in items:
+                print(f"  {item}")
+    if failures or regressions:
+        return 1
+    print("All templates within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
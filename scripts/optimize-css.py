@@ -2,146 +2,1432 @@
 """
 CSS Optimization Script for Shopify Theme
 Removes unused CSS rules based on template analysis
+
+Stylesheets are parsed into a small rule tree (qualified rules plus nested
+@media/@supports/... blocks), so unused selectors inside media queries are
+pruned as well.
+
+Usage:
+    python scripts/optimize-css.py          # assets/base.css -> assets/base-optimized.css
+    python scripts/optimize-css.py --all    # every assets/*.css -> build/optimized-css/
+    python scripts/optimize-css.py --critical  # per-template critical snippet + deferred CSS -> build/critical-css/
+    python scripts/optimize-css.py --watch  # re-run whenever a template, script or stylesheet changes
+    python scripts/optimize-css.py --check-merges  # fail if minifying base.css merges a rule with its fallback
 """
 
+import argparse
+import gzip
+import hashlib
+import json
 import re
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def get_used_classes():
-    """Scan templates for actually used CSS classes"""
-    used_classes = set()
-    used_ids = set()
-    
-    # Define directories to scan
-    template_dirs = ['templates', 'sections', 'snippets', 'layout']
-    
-    for dir_name in template_dirs:
+from theme_graph import (
+    get_render_graph,
+    iter_json_templates,
+    json_section_files,
+    layout_roots,
+    linked_assets,
+    parse_json_template,
+    read_text,
+    render_closure,
+    template_name,
+)
+
+try:
+    import brotli
+except ImportError:  # optional: brotli sizes are reported only when it is installed
+    brotli = None
+
+TEMPLATE_DIRS = ['templates', 'sections', 'snippets', 'layout', 'blocks']
+# JSON templates and section groups carry section settings rendered into markup
+JSON_TEMPLATE_DIRS = ['templates', 'sections']
+SCRIPT_DIR = 'assets'
+CLASS_CACHE_FILE = 'build/.template-class-cache.json'
+# Bump when the extraction rules change so stale cache entries are discarded
+CLASS_CACHE_VERSION = 5
+
+_IDENT_RE = re.compile(r'^-?[_a-zA-Z][\w-]*$')
+_SCRIPT_BLOCK_RE = re.compile(
+    r'<script\b[^>]*>(.*?)</script>|{%-?\s*javascript\s*-?%}(.*?){%-?\s*endjavascript\s*-?%}',
+    re.S | re.I,
+)
+_JS_STRING_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`', re.S)
+_JS_ID_CALL_RE = re.compile(r'getElementById\(\s*[\'"`]([\w-]+)(\$\{)?')
+_SELECTOR_TOKEN_RE = re.compile(r'([.#])(-?[_a-zA-Z][\w-]*)(\$\{)?')
+_PREFIX_RE = re.compile(r'^-?[_a-zA-Z][\w-]*[-_]$')
+# Section setting values that can land in a class attribute, and the keys that hold copy instead
+_SETTING_VALUE_RE = re.compile(r'^[a-z][a-z0-9]*(?:[-_][a-z0-9]+)*$')
+_COPY_SETTING_RE = re.compile(r'heading|title|text|label|caption|description|content|message|placeholder')
+# How far back from a string literal to look for the call it is passed to
+_JS_CONTEXT_CHARS = 120
+_JS_SELECTOR_CONTEXT_RE = re.compile(r'\b(?:querySelector(?:All)?|closest|matches)\(\s*[^;()]*$')
+_JS_CLASS_CONTEXT_RE = re.compile(
+    r'(?:\bclassList\.\w+\(|\bclassName\s*\+?=|setAttribute\(\s*[\'"]class[\'"]\s*,)[^;()]*$'
+)
+# Outside those calls only lowercase hyphen/underscore names count (cart-drawer__inner, is-open)
+_JS_CLASS_LIKE_RE = re.compile(r'^[a-z][a-z0-9]*(?:[-_]+[a-z0-9]+)+[-_]?$')
+
+
+def _new_usage():
+    return {'classes': set(), 'ids': set(), 'class_prefixes': set(), 'id_prefixes': set()}
+
+
+def _merge_usage(usage, other):
+    for key, names in other.items():
+        usage[key].update(names)
+
+
+def _add_name(usage, kind, name, is_prefix=False):
+    """Record a class (``kind='class'``) or ID; names glued to a dynamic part are kept as prefixes"""
+    if is_prefix:
+        if len(name) >= 3 and _PREFIX_RE.match(name):
+            usage[kind + '_prefixes'].add(name)
+    elif _IDENT_RE.match(name):
+        usage['classes' if kind == 'class' else 'ids'].add(name)
+
+
+# Stand-in for any value only known at render time
+_DYNAMIC = '\x00'
+# Cap on the alternatives enumerated for one attribute; beyond it every
+# branch's words are still collected, just not glued across tag boundaries
+_MAX_ALTERNATIVES = 256
+# Variables holding longer values (captured markup, accumulated strings) are
+# treated as dynamic; class lists are far shorter
+_MAX_VARIABLE_LENGTH = 256
+
+_LIQUID_RE = re.compile(r'{{-?(.*?)-?}}|{%-?(.*?)-?%}', re.S)
+_ATTR_RE = re.compile(r'(?<![\w:-])(class|id)\s*=\s*(["\'])')
+_ASSIGN_RE = re.compile(r'^\s*assign\s+([\w.]+)\s*=\s*(.+?)\s*$', re.S)
+_CAPTURE_RE = re.compile(r'{%-?\s*capture\s+([\w.]+)\s*-?%}(.*?){%-?\s*endcapture\s*-?%}', re.S)
+_CLASS_ARG_RE = re.compile(r'\b(\w*class\w*|id)\s*:\s*("[^"]*"|\'[^\']*\')')
+_SCHEMA_RE = re.compile(r'{%-?\s*schema\s*-?%}(.*?){%-?\s*endschema\s*-?%}', re.S)
+_BRANCH_OPEN = {'if', 'unless', 'case'}
+_BRANCH_SPLIT = {'elsif', 'else', 'when'}
+_BRANCH_CLOSE = {'endif', 'endunless', 'endcase'}
+
+
+def _split_outside_quotes(text, sep):
+    parts, start, quote = [], 0, None
+    for pos, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == sep:
+            parts.append(text[start:pos])
+            start = pos + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _resolve_term(term, variables):
+    """Possible literal values of a Liquid term: a string, a known variable, or dynamic"""
+    term = term.strip()
+    if len(term) >= 2 and term[0] == term[-1] and term[0] in '"\'':
+        return {term[1:-1]}
+    if term in variables:
+        return variables[term]
+    return {_DYNAMIC}
+
+
+def _resolve_output(expression, variables):
+    """Possible values of ``{{ expression }}``, following append/prepend/default filters"""
+    parts = _split_outside_quotes(expression, '|')
+    values = _resolve_term(parts[0], variables)
+    for part in parts[1:]:
+        name, _, arg = part.partition(':')
+        name = name.strip()
+        if name in ('append', 'prepend'):
+            args = _resolve_term(arg, variables)
+            if name == 'append':
+                values = {value + extra for value in values for extra in args}
+            else:
+                values = {extra + value for value in values for extra in args}
+        elif name == 'default':
+            values = values | _resolve_term(arg, variables)
+        elif name == 'downcase':
+            values = {value.lower() for value in values}
+        elif name in ('escape', 'strip', 'lstrip', 'rstrip'):
+            continue
+        else:
+            values = {_DYNAMIC}
+        if len(values) > _MAX_ALTERNATIVES:
+            return {_DYNAMIC}
+    return values
+
+
+def _tag_name(tag):
+    return tag.strip().split(None, 1)[0] if tag.strip() else ''
+
+
+def _parse_liquid_sequence(tokens, pos=0):
+    """Group lexed tokens into a sequence where if/unless/case become branch lists"""
+    sequence = []
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        name = _tag_name(value) if kind == 'tag' else ''
+        if name in _BRANCH_SPLIT or name in _BRANCH_CLOSE:
+            return sequence, pos
+        pos += 1
+        if name in _BRANCH_OPEN:
+            branches, has_else = [], False
+            branch, pos = _parse_liquid_sequence(tokens, pos)
+            if name != 'case':
+                branches.append(branch)
+            while pos < len(tokens):
+                split = _tag_name(tokens[pos][1])
+                pos += 1
+                if split in _BRANCH_CLOSE:
+                    break
+                has_else = has_else or split == 'else'
+                branch, pos = _parse_liquid_sequence(tokens, pos)
+                branches.append(branch)
+            if not has_else:
+                branches.append([])
+            sequence.append(('branch', branches))
+        elif name == 'cycle':
+            args = value.strip()[len('cycle'):].split(':', 1)[-1]
+            sequence.append(('choice', [arg for arg in _split_outside_quotes(args, ',') if arg.strip()]))
+        else:
+            sequence.append((kind, value))
+    return sequence, pos
+
+
+def _lex_liquid(text):
+    tokens, pos = [], 0
+    for match in _LIQUID_RE.finditer(text):
+        if match.start() > pos:
+            tokens.append(('text', text[pos:match.start()]))
+        if match.group(1) is not None:
+            tokens.append(('output', match.group(1)))
+        else:
+            tokens.append(('tag', match.group(2)))
+        pos = match.end()
+    if pos < len(text):
+        tokens.append(('text', text[pos:]))
+    return tokens
+
+
+def _expand_sequence(sequence, variables):
+    """Every string the sequence can render, with dynamic parts as _DYNAMIC"""
+    alternatives = {''}
+    for kind, value in sequence:
+        if kind == 'text':
+            options = {value}
+        elif kind == 'output':
+            options = _resolve_output(value, variables)
+        elif kind == 'choice':
+            options = set()
+            for arg in value:
+                options |= _resolve_term(arg, variables)
+        elif kind == 'branch':
+            options = set()
+            for branch in value:
+                options |= _expand_sequence(branch, variables)
+        else:
+            # Other tags (for, assign, render, ...) render nothing literal here
+            options = {' '}
+        if len(options) > _MAX_ALTERNATIVES:
+            options = {' '.join(options)}
+        if len(alternatives) * len(options) > _MAX_ALTERNATIVES:
+            # Too many combinations: keep every word but stop gluing across this boundary
+            alternatives = {' '.join(alternatives) + ' '}
+        alternatives = {prefix + option for prefix in alternatives for option in options}
+    return alternatives
+
+
+def _add_words(usage, kind, rendered):
+    for word in rendered.split():
+        if _DYNAMIC in word:
+            head = word.split(_DYNAMIC, 1)[0]
+            if head:
+                _add_name(usage, kind, head, True)
+        else:
+            _add_name(usage, kind, word)
+
+
+def _read_attribute_value(content, pos, quote):
+    """Return (value, end) for an attribute value, skipping quotes inside Liquid"""
+    start = pos
+    while pos < len(content):
+        char = content[pos]
+        if char == quote:
+            return content[start:pos], pos + 1
+        if char == '{' and content[pos + 1:pos + 2] in ('{', '%'):
+            close = content.find('}}' if content[pos + 1] == '{' else '%}', pos + 2)
+            if close == -1:
+                break
+            pos = close + 2
+            continue
+        if char == '<':
+            break
+        pos += 1
+    return None, pos
+
+
+def _schema_setting_values(content):
+    """Map ``section.settings.<id>``/``block.settings.<id>`` to the values a
+    select or radio setting in the file's ``{% schema %}`` can take"""
+    match = _SCHEMA_RE.search(content)
+    if not match:
+        return {}
+    try:
+        schema = json.loads(match.group(1))
+    except ValueError:
+        return {}
+    if not isinstance(schema, dict):
+        return {}
+    options = {}
+    groups = [('section', schema.get('settings', []))]
+    groups.extend(('block', block.get('settings', [])) for block in schema.get('blocks', []) if isinstance(block, dict))
+    for owner, settings in groups:
+        for setting in settings:
+            if not isinstance(setting, dict) or setting.get('type') not in ('select', 'radio'):
+                continue
+            values = {str(option.get('value', '')) for option in setting.get('options', []) if isinstance(option, dict)}
+            name = f"{owner}.settings.{setting.get('id')}"
+            options[name] = options.get(name, set()) | values
+    return options
+
+
+def _collect_variables(content):
+    """Literal values each assigned/captured variable can take in this file"""
+    variables = _schema_setting_values(content)
+
+    def record(name, values):
+        values = variables.get(name, {''}) | values
+        if len(values) > _MAX_ALTERNATIVES or any(len(value) > _MAX_VARIABLE_LENGTH for value in values):
+            values = {_DYNAMIC}
+        variables[name] = values
+
+    for match in _LIQUID_RE.finditer(content):
+        tag = match.group(2)
+        if tag is None:
+            continue
+        lines = tag.strip().splitlines()[1:] if _tag_name(tag) == 'liquid' else [tag]
+        for line in lines:
+            assign = _ASSIGN_RE.match(line)
+            if assign:
+                record(assign.group(1), _resolve_output(assign.group(2), variables))
+    for match in _CAPTURE_RE.finditer(content):
+        body = match.group(2)
+        if len(body) > _MAX_VARIABLE_LENGTH or '<' in body:
+            record(match.group(1), {_DYNAMIC})
+            continue
+        sequence, _ = _parse_liquid_sequence(_lex_liquid(body))
+        record(match.group(1), _expand_sequence(sequence, variables))
+    return variables
+
+
+def extract_liquid_selectors(content):
+    """Return the class names and IDs referenced by one Liquid file
+
+    ``class``/``id`` attribute values are lexed as Liquid: every branch of
+    ``{% if %}``/``{% unless %}``/``{% case %}`` is enumerated, ``{{ }}``
+    outputs resolve through string literals, ``assign``/``capture`` variables
+    and ``append``/``prepend`` filters, and a word glued to a value only known
+    at render time (``color-{{ section.settings.color_scheme }}``) is kept as
+    a prefix. ``class: '...'`` arguments to render tags and filters count too.
+    """
+    usage = _new_usage()
+    variables = _collect_variables(content)
+
+    pos = 0
+    while True:
+        match = _ATTR_RE.search(content, pos)
+        if not match:
+            break
+        value, pos = _read_attribute_value(content, match.end(), match.group(2))
+        if value is None:
+            continue
+        kind = 'class' if match.group(1) == 'class' else 'id'
+        sequence, _ = _parse_liquid_sequence(_lex_liquid(value))
+        for rendered in _expand_sequence(sequence, variables):
+            _add_words(usage, kind, rendered)
+
+    for match in _LIQUID_RE.finditer(content):
+        for arg in _CLASS_ARG_RE.finditer(match.group(1) or match.group(2)):
+            _add_words(usage, 'id' if arg.group(1) == 'id' else 'class', arg.group(2)[1:-1])
+
+    # Inline scripts toggle classes just like the asset scripts do
+    for match in _SCRIPT_BLOCK_RE.finditer(content):
+        _merge_usage(usage, extract_js_selectors(match.group(1) or match.group(2) or ''))
+
+    return usage
+
+
+def extract_js_selectors(content):
+    """Return the class names and IDs a script can reference through string literals
+
+    Literals passed to ``querySelector*``/``closest``/``matches`` contribute
+    their ``.class``/``#id`` parts, and literals passed to ``classList.*`` or
+    assigned to ``className`` contribute every word as a class. Any other
+    literal (messages, error names, event types) only contributes names that
+    look like theme classes: lowercase words joined by ``-`` or ``_``, or
+    ``.class``/``#id`` tokens of a literal that starts as a selector. A name
+    followed by ``${...}`` in a template literal is kept as a prefix.
+    """
+    usage = _new_usage()
+    for match in _JS_STRING_RE.finditer(content):
+        literal = match.group(0)[1:-1]
+        if not literal or len(literal) > 200:
+            continue
+        context = content[max(0, match.start() - _JS_CONTEXT_CHARS):match.start()]
+        if '.' in literal or '#' in literal:
+            trusted = bool(_JS_SELECTOR_CONTEXT_RE.search(context)) or literal.lstrip()[:1] in ('.', '#')
+            for token in _SELECTOR_TOKEN_RE.finditer(literal):
+                if trusted or _JS_CLASS_LIKE_RE.match(token.group(2)):
+                    _add_name(usage, 'class' if token.group(1) == '.' else 'id', token.group(2), bool(token.group(3)))
+            continue
+        trusted = bool(_JS_CLASS_CONTEXT_RE.search(context))
+        for word in literal.split():
+            name, is_prefix = (word.split('${', 1)[0], True) if '${' in word else (word, False)
+            if trusted or _JS_CLASS_LIKE_RE.match(name):
+                _add_name(usage, 'class', name, is_prefix)
+    for match in _JS_ID_CALL_RE.finditer(content):
+        _add_name(usage, 'id', match.group(1), bool(match.group(2)))
+    return usage
+
+
+def _iter_setting_strings(value, in_settings=False, key=None):
+    """Yield ``(setting key, string value)`` for every string under ``settings``/``custom_css``"""
+    if isinstance(value, dict):
+        for item_key, item in value.items():
+            yield from _iter_setting_strings(item, in_settings or item_key in ('settings', 'custom_css'), item_key)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_setting_strings(item, in_settings, key)
+    elif in_settings and isinstance(value, str):
+        yield key, value
+
+
+def extract_json_selectors(content):
+    """Return the class names and IDs a JSON template's section settings can produce
+
+    Richtext HTML and ``custom_css`` contribute the classes and IDs they
+    contain. A plain value only counts when it could be a class: a single
+    lowercase name such as a select/radio id or ``color_scheme``
+    (``scheme-1``), on a setting that is not copy (headings, text, labels).
+    """
+    usage = _new_usage()
+    data = parse_json_template(content)
+    if data is None:
+        return usage
+    for key, value in _iter_setting_strings(data):
+        if '<' in value:
+            _merge_usage(usage, extract_liquid_selectors(value))
+        elif '{' in value:
+            for token in _SELECTOR_TOKEN_RE.finditer(value):
+                _add_name(usage, 'class' if token.group(1) == '.' else 'id', token.group(2))
+        elif _SETTING_VALUE_RE.match(value) and not _COPY_SETTING_RE.search(str(key)):
+            _add_name(usage, 'class', value)
+    return usage
+
+
+_EXTRACTORS = {
+    '.liquid': extract_liquid_selectors,
+    '.json': extract_json_selectors,
+    '.js': extract_js_selectors,
+}
+
+
+def iter_source_files(include_dead=False):
+    """Every theme file whose markup or scripts can reference a selector
+
+    Unless ``include_dead``, files the render graph cannot reach from any
+    template (and scripts no live file loads) are skipped, so classes only
+    dead sections use do not keep their rules alive.
+    """
+    live = None
+    if not include_dead:
+        graph = get_render_graph()
+        live = graph.reachable() | graph.live_assets('.js')
+    for dir_name in TEMPLATE_DIRS:
         if os.path.exists(dir_name):
             for root, dirs, files in os.walk(dir_name):
                 for file in files:
-                    if file.endswith('.liquid'):
-                        file_path = os.path.join(root, file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                
-                                # Find class attributes (handle Liquid syntax)
-                                class_matches = re.findall(r'class=["\']([^"\']+)["\']', content)
-                                for match in class_matches:
-                                    # Clean up liquid syntax and get actual classes
-                                    clean_match = re.sub(r'{[^}]*}', ' ', match)  # Remove liquid variables
-                                    classes = [cls.strip() for cls in clean_match.split() if cls.strip() and not cls.startswith('{') and not cls.startswith('%')]
-                                    used_classes.update(classes)
-                                
-                                # Find id attributes
-                                id_matches = re.findall(r'id=["\']([^"\']+)["\']', content)
-                                used_ids.update(id_matches)
-                                
-                        except Exception as e:
-                            print(f"Error reading {file_path}: {e}")
-    
-    return used_classes, used_ids
+                    if file.endswith('.liquid') or (file.endswith('.json') and dir_name in JSON_TEMPLATE_DIRS):
+                        path = os.path.join(root, file)
+                        if live is None or path in live:
+                            yield path
+    if os.path.exists(SCRIPT_DIR):
+        for file in sorted(os.listdir(SCRIPT_DIR)):
+            path = os.path.join(SCRIPT_DIR, file)
+            if file.endswith('.js') and (live is None or path in live):
+                yield path
+
+
+class SelectorUsageIndex:
+    """Classes and IDs referenced anywhere in the theme, built once per run
+
+    Exact names are set lookups. Names only known by a prefix
+    (``Details-{{ section.id }}``, ``#Quantity-${id}``) are matched by probing
+    the candidate's own prefixes against a set, one probe per distinct prefix
+    length, so lookups never scan the prefix list.
+    """
+
+    __slots__ = ('classes', 'ids', 'class_prefixes', 'id_prefixes', '_class_prefix_lengths', '_id_prefix_lengths')
+
+    def __init__(self, classes=(), ids=(), class_prefixes=(), id_prefixes=()):
+        self.classes = frozenset(classes)
+        self.ids = frozenset(ids)
+        self.class_prefixes = frozenset(class_prefixes)
+        self.id_prefixes = frozenset(id_prefixes)
+        self._class_prefix_lengths = sorted({len(prefix) for prefix in self.class_prefixes})
+        self._id_prefix_lengths = sorted({len(prefix) for prefix in self.id_prefixes})
+
+    def __getstate__(self):
+        return (self.classes, self.ids, self.class_prefixes, self.id_prefixes)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @staticmethod
+    def _matches(name, exact, prefixes, lengths):
+        if name in exact:
+            return True
+        return any(name[:length] in prefixes for length in lengths if length < len(name))
+
+    def has_class(self, name):
+        return self._matches(name, self.classes, self.class_prefixes, self._class_prefix_lengths)
+
+    def has_id(self, name):
+        return self._matches(name, self.ids, self.id_prefixes, self._id_prefix_lengths)
+
+
+def _load_class_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CLASS_CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def _save_class_cache(cache_file, entries):
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': CLASS_CACHE_VERSION, 'files': entries}, f)
+
+
+def scan_source_files(cache_file=None, include_dead=False):
+    """Return ``{path: usage entry}`` for every live Liquid, JSON template and script
+
+    With ``cache_file`` each file's extracted classes and IDs are stored
+    against its content hash, so only files that changed since the last run
+    are re-scanned. Unchanged size and mtime skip even the hashing.
+    """
+    cached = _load_class_cache(cache_file) if cache_file else {}
+    entries = {}
+    rescanned = 0
+
+    for file_path in iter_source_files(include_dead):
+        try:
+            stat = os.stat(file_path)
+            entry = cached.get(file_path)
+            if not (entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size):
+                with open(file_path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+                if not (entry and entry['hash'] == digest):
+                    extractor = _EXTRACTORS[os.path.splitext(file_path)[1]]
+                    entry = {key: sorted(names) for key, names in extractor(raw.decode('utf-8')).items()}
+                    entry['hash'] = digest
+                    rescanned += 1
+                entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            entries[file_path] = entry
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+
+    if cache_file:
+        _save_class_cache(cache_file, entries)
+        print(f"Scanned {rescanned} changed of {len(entries)} source files")
+
+    return entries
+
+
+# Markup Shopify writes at render time, so the templates never spell it out:
+# {{ form | payment_button }} (.shopify-payment-button__button--unbranded, ...),
+# the bot challenge page (.shopify-challenge__*), app block wrappers
+# (.shopify-app-block) and section wrappers (#shopify-section-<id>). This is
+# all that is left of the old ESSENTIAL_SELECTOR_PATTERNS allowlist: the
+# Liquid lexer finds everything else in the templates, these can only be listed.
+PLATFORM_CLASSES = {
+    'shopify-payment-button', 'shopify-payment-button__button', 'shopify-payment-button__button--unbranded',
+    'shopify-payment-button__button--hidden', 'shopify-payment-button__more-options',
+    'shopify-challenge__container', 'shopify-challenge__message', 'shopify-challenge__button',
+    'shopify-app-block', 'shopify-section',
+}
+PLATFORM_CLASS_PREFIXES = {'shopify-'}
+PLATFORM_ID_PREFIXES = {'shopify-section-', 'shopify-block-'}
+
+
+def usage_index_for(entries, paths=None):
+    """Fold the scanned entries (or only those for ``paths``) into a SelectorUsageIndex
+
+    The index is seeded with the PLATFORM_* names Shopify renders itself.
+    """
+    usage = _new_usage()
+    usage['classes'].update(PLATFORM_CLASSES)
+    usage['class_prefixes'].update(PLATFORM_CLASS_PREFIXES)
+    usage['id_prefixes'].update(PLATFORM_ID_PREFIXES)
+    for path in entries if paths is None else paths:
+        entry = entries.get(path)
+        if entry:
+            for key in usage:
+                usage[key].update(entry[key])
+    return SelectorUsageIndex(**usage)
+
+
+def build_usage_index(cache_file=None):
+    """Scan Liquid, JSON templates and scripts into a SelectorUsageIndex"""
+    return usage_index_for(scan_source_files(cache_file))
+
+
+def get_used_classes(cache_file=None):
+    """Scan templates for actually used CSS classes"""
+    index = build_usage_index(cache_file)
+    return set(index.classes), set(index.ids)
+
+# At-rules whose blocks contain further rules; their children are pruned
+# individually. Other block at-rules (@keyframes, @font-face, ...) are kept whole.
+NESTED_AT_RULES = {'media', 'supports', 'layer', 'container', 'document', '-moz-document', 'scope'}
+
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'', re.S)
+_BLOCK_TOKEN_RE = re.compile(r'[{}"\']|/\*')
+_PRELUDE_TOKEN_RE = re.compile(r'[{};"\'()\[\]]|/\*')
+_CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+_ID_RE = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+_NOT_RE = re.compile(r':not\([^()]*\)')
+
+
+class CssRule:
+    """A qualified rule: ``selector { declarations }``."""
+
+    def __init__(self, selector, body):
+        self.selector = selector
+        self.body = body
+
+    def to_css(self):
+        return f"{self.selector} {self.body}"
+
+
+class CssAtRule:
+    """An at-rule. ``children`` is a list of nodes for nested at-rules such as
+    @media; otherwise ``body`` holds the raw block (or is empty for statements
+    like @import)."""
+
+    def __init__(self, name, prelude, children=None, body=''):
+        self.name = name
+        self.prelude = prelude
+        self.children = children
+        self.body = body
+
+    def to_css(self):
+        head = f"@{self.name} {self.prelude}".rstrip()
+        if self.children is not None:
+            inner = '\n'.join(child.to_css() for child in self.children)
+            return f"{head} {{\n{inner}\n}}"
+        if self.body:
+            return f"{head} {self.body}"
+        return f"{head};"
+
+
+def _skip_comment(css, pos):
+    end = css.find('*/', pos + 2)
+    return len(css) if end == -1 else end + 2
+
+
+def _skip_string(css, pos):
+    match = _STRING_RE.match(css, pos)
+    return match.end() if match else pos + 1
+
+
+def _find_block_end(css, pos):
+    """Return the index just past the ``}`` matching the ``{`` at ``pos``."""
+    depth = 0
+    while True:
+        match = _BLOCK_TOKEN_RE.search(css, pos)
+        if not match:
+            return len(css)
+        token = match.group()
+        pos = match.start()
+        if token == '/*':
+            pos = _skip_comment(css, pos)
+        elif token in '"\'':
+            pos = _skip_string(css, pos)
+        else:
+            depth += 1 if token == '{' else -1
+            pos += 1
+            if depth == 0:
+                return pos
+
+
+def _read_prelude(css, pos):
+    """Read up to the next top-level ``{``, ``;`` or ``}``.
+
+    Returns the prelude text with comments removed, the terminating
+    character ('' at end of input) and its index.
+    """
+    parts = []
+    depth = 0
+    start = pos
+    while True:
+        match = _PRELUDE_TOKEN_RE.search(css, pos)
+        if not match:
+            parts.append(css[start:])
+            return ''.join(parts), '', len(css)
+        token = match.group()
+        pos = match.start()
+        if token == '/*':
+            parts.append(css[start:pos])
+            pos = start = _skip_comment(css, pos)
+        elif token in '"\'':
+            pos = _skip_string(css, pos)
+        elif token in '([':
+            depth += 1
+            pos += 1
+        elif token in ')]':
+            depth = max(0, depth - 1)
+            pos += 1
+        elif depth and token in '{;':
+            pos += 1
+        else:
+            parts.append(css[start:pos])
+            return ''.join(parts), token, pos
+
+
+def parse_css(css, pos=0, nested=False):
+    """Parse CSS into a list of CssRule / CssAtRule nodes in a single pass.
+
+    Strings and comments are skipped when matching braces, so braces inside
+    them no longer break rule boundaries. Returns ``(nodes, end_pos)``.
+    """
+    nodes = []
+    length = len(css)
+    while pos < length:
+        prelude, terminator, pos = _read_prelude(css, pos)
+        prelude = prelude.strip()
+        if terminator == '':
+            break
+        if terminator == '}':
+            pos += 1
+            if nested:
+                return nodes, pos
+            continue
+        if terminator == ';':
+            pos += 1
+            if prelude.startswith('@'):
+                name, _, rest = prelude[1:].partition(' ')
+                nodes.append(CssAtRule(name.lower(), rest.strip()))
+            continue
+
+        # terminator == '{'
+        if prelude.startswith('@'):
+            name, _, rest = prelude[1:].partition(' ')
+            name = name.lower()
+            if name in NESTED_AT_RULES:
+                children, pos = parse_css(css, pos + 1, nested=True)
+                nodes.append(CssAtRule(name, rest.strip(), children=children))
+            else:
+                end = _find_block_end(css, pos)
+                nodes.append(CssAtRule(name, rest.strip(), body=css[pos:end]))
+                pos = end
+        else:
+            end = _find_block_end(css, pos)
+            nodes.append(CssRule(' '.join(prelude.split()), css[pos:end]))
+            pos = end
+    return nodes, pos
+
+
+def split_selectors(selector):
+    """Split a selector list on top-level commas (not inside :is(), [attr=","], ...)."""
+    selectors = []
+    depth = 0
+    start = 0
+    pos = 0
+    while pos < len(selector):
+        char = selector[pos]
+        if char in '"\'':
+            pos = _skip_string(selector, pos)
+            continue
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth = max(0, depth - 1)
+        elif char == ',' and depth == 0:
+            selectors.append(selector[start:pos].strip())
+            start = pos + 1
+        pos += 1
+    selectors.append(selector[start:].strip())
+    return [sel for sel in selectors if sel]
+
 
-def optimize_css_file(input_file, output_file, used_classes, used_ids):
+def selector_is_used(selector, index, strict=False):
+    """Keep a selector if it references no class or ID at all
+    (element, attribute and pseudo selectors), or references at least one
+    class or ID found in the templates or scripts. ``strict`` requires every
+    class and ID in the selector to be used."""
+    positive = _NOT_RE.sub('', _STRING_RE.sub('""', selector))
+    classes = _CLASS_RE.findall(positive)
+    ids = _ID_RE.findall(positive)
+    if not classes and not ids:
+        return True
+    if strict:
+        return all(index.has_class(cls) for cls in classes) and all(index.has_id(id_) for id_ in ids)
+    return any(index.has_class(cls) for cls in classes) or any(index.has_id(id_) for id_ in ids)
+
+
+def prune_nodes(nodes, index, strict=False):
+    """Return the nodes still needed, pruning selectors inside @media/@supports too."""
+    kept = []
+    for node in nodes:
+        if isinstance(node, CssRule):
+            selectors = [
+                sel for sel in split_selectors(node.selector)
+                if selector_is_used(sel, index, strict)
+            ]
+            if selectors:
+                kept.append(CssRule(', '.join(selectors), node.body))
+        elif node.children is not None:
+            children = prune_nodes(node.children, index, strict)
+            if children:
+                kept.append(CssAtRule(node.name, node.prelude, children=children))
+        else:
+            kept.append(node)
+    return kept
+
+
+_MINIFY_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|\s+|[^"\'/\s]+|/', re.S)
+# No whitespace is needed next to these characters in each context
+_SELECTOR_PUNCTUATION = ',>+~'
+_PRELUDE_PUNCTUATION = ',:'
+_BODY_PUNCTUATION = '{};:,>!'
+_NESTED_BODY_PUNCTUATION = '{};,'
+_SHORTHAND_SIDES = ('top', 'right', 'bottom', 'left')
+_SHORTHAND_PROPERTIES = ('margin', 'padding')
+
+
+def minify_text(text, punctuation):
+    """Strip comments and collapse whitespace, keeping it only where it separates tokens"""
+    out = []
+    pending_space = False
+    for match in _MINIFY_TOKEN_RE.finditer(text):
+        token = match.group()
+        if token.isspace() or token.startswith('/*'):
+            pending_space = True
+            continue
+        if pending_space and out and out[-1][-1] not in punctuation and token[0] not in punctuation:
+            out.append(' ')
+        pending_space = False
+        out.append(token)
+    return ''.join(out)
+
+
+def _drop_trailing_semicolons(text):
+    parts = _STRING_RE.split(text)
+    strings = _STRING_RE.findall(text)
+    result = [re.sub(r';+}', '}', part) for part in parts]
+    return ''.join(part + (strings[i] if i < len(strings) else '') for i, part in enumerate(result))
+
+
+def _split_declarations(inner):
+    """Split a declaration block on top-level ``;`` (not inside strings or parentheses)"""
+    declarations, depth, start, pos = [], 0, 0, 0
+    while pos < len(inner):
+        char = inner[pos]
+        if char in '"\'':
+            pos = _skip_string(inner, pos)
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif char == ';' and depth == 0:
+            declarations.append(inner[start:pos])
+            start = pos + 1
+        pos += 1
+    declarations.append(inner[start:])
+    return [declaration for declaration in declarations if declaration.strip()]
+
+
+def _compact_box(values):
+    top, right, bottom, left = values
+    if left == right:
+        if top == bottom:
+            return top if top == right else f"{top} {right}"
+        return f"{top} {right} {bottom}"
+    return f"{top} {right} {bottom} {left}"
+
+
+def merge_shorthands(declarations):
+    """Fold margin-*/padding-* longhands into one shorthand when all four sides are set once"""
+    parsed = []
+    for declaration in declarations:
+        prop, sep, value = declaration.partition(':')
+        parsed.append((prop.strip().lower(), value.strip()) if sep else (None, declaration))
+    for shorthand in _SHORTHAND_PROPERTIES:
+        names = [f"{shorthand}-{side}" for side in _SHORTHAND_SIDES]
+        positions = {name: [i for i, (prop, _) in enumerate(parsed) if prop == name] for name in names}
+        if any(len(found) != 1 for found in positions.values()):
+            continue
+        indexes = [positions[name][0] for name in names]
+        values = [parsed[i][1] for i in indexes]
+        first, last = min(indexes), max(indexes)
+        between = {parsed[i][0] for i in range(first, last + 1)} - set(names)
+        if any(prop and (prop == shorthand or prop.startswith(shorthand + '-')) for prop in between):
+            continue
+        important = {value.lower().endswith('!important') for value in values}
+        if len(important) != 1 or any('var(' in value for value in values):
+            continue
+        if important == {True}:
+            values = [value[:-len('!important')].rstrip() for value in values]
+        shorthand_value = _compact_box(values) + ('!important' if important == {True} else '')
+        parsed[first] = (shorthand, shorthand_value)
+        for i in sorted(set(indexes) - {first}, reverse=True):
+            parsed.pop(i)
+    return [f"{prop}:{value}" if prop else value for prop, value in parsed]
+
+
+def minify_body(body):
+    """Minify a ``{ ... }`` declaration block, merging box shorthands when it has no nested rules"""
+    inner = body.strip()[1:-1]
+    if '{' in inner:
+        # Nested rules: `& :hover` and `&:hover` differ, so keep spaces around ':' and '>'
+        return _drop_trailing_semicolons('{' + minify_text(inner, _NESTED_BODY_PUNCTUATION) + '}')
+    declarations = [minify_text(declaration, _BODY_PUNCTUATION) for declaration in _split_declarations(inner)]
+    return _drop_trailing_semicolons('{' + ';'.join(merge_shorthands(declarations)) + '}')
+
+
+# Pseudo-classes older browsers reject: one invalid selector drops the whole
+# list, so a rule using them must not absorb the fallback rule written next to it
+_UNSAFE_MERGE_RE = re.compile(r':-|:focus-visible\b|:(?:has|is|where)\(|:not\([^()]*,')
+
+
+def _merge_safe(selector):
+    # Vendor pseudo-classes and newer or forgiving-only ones stay in their own rule
+    return not _UNSAFE_MERGE_RE.search(selector)
+
+
+def collapse_rules(nodes):
+    """Minify a rule list and collapse duplicates
+
+    Identical selector+body rules keep only their last occurrence, adjacent rules
+    with the same selector merge their declarations, adjacent rules with the same
+    declarations merge their selectors, and adjacent identical @media/@supports
+    blocks merge their children.
+    """
+    minified = []
+    for node in nodes:
+        if isinstance(node, CssRule):
+            minified.append(CssRule(minify_text(node.selector, _SELECTOR_PUNCTUATION), minify_body(node.body)))
+        elif node.children is not None:
+            minified.append(CssAtRule(node.name, minify_text(node.prelude, _PRELUDE_PUNCTUATION),
+                                      children=collapse_rules(node.children)))
+        else:
+            body = minify_text(node.body, _BODY_PUNCTUATION) if node.body else ''
+            minified.append(CssAtRule(node.name, minify_text(node.prelude, _PRELUDE_PUNCTUATION),
+                                      body=_drop_trailing_semicolons(body)))
+
+    minified = [node for node in minified if not (isinstance(node, CssRule) and node.body == '{}')]
+    last_seen = {}
+    for i, node in enumerate(minified):
+        if isinstance(node, CssRule):
+            last_seen[(node.selector, node.body)] = i
+    deduped = [
+        node for i, node in enumerate(minified)
+        if not isinstance(node, CssRule) or last_seen[(node.selector, node.body)] == i
+    ]
+
+    collapsed = []
+    for node in deduped:
+        previous = collapsed[-1] if collapsed else None
+        if isinstance(node, CssRule) and isinstance(previous, CssRule):
+            if node.selector == previous.selector:
+                collapsed[-1] = CssRule(node.selector, '{' + previous.body[1:-1] + ';' + node.body[1:])
+                continue
+            if node.body == previous.body and _merge_safe(node.selector) and _merge_safe(previous.selector):
+                collapsed[-1] = CssRule(previous.selector + ',' + node.selector, node.body)
+                continue
+        if (isinstance(node, CssAtRule) and isinstance(previous, CssAtRule)
+                and node.children is not None and previous.children is not None
+                and (node.name, node.prelude) == (previous.name, previous.prelude)):
+            collapsed[-1] = CssAtRule(node.name, node.prelude, children=collapse_rules(previous.children + node.children))
+            continue
+        collapsed.append(node)
+    return collapsed
+
+
+def _iter_rules(nodes):
+    for node in nodes:
+        if isinstance(node, CssRule):
+            yield node
+        elif node.children is not None:
+            yield from _iter_rules(node.children)
+
+
+def unsafe_merges(nodes):
+    """Collapsed selector lists that join a merge-unsafe selector with one from another rule
+
+    Lists the stylesheet already wrote together are fine; an empty result
+    means collapse_rules kept every :focus-visible/:has()/... rule apart
+    from its fallback.
+    """
+    written = {}
+    for rule in _iter_rules(nodes):
+        selectors = frozenset(split_selectors(minify_text(rule.selector, _SELECTOR_PUNCTUATION)))
+        for sel in selectors:
+            written.setdefault(sel, []).append(selectors)
+    unsafe = []
+    for rule in _iter_rules(collapse_rules(nodes)):
+        selectors = split_selectors(rule.selector)
+        if len(selectors) < 2 or _merge_safe(rule.selector):
+            continue
+        if not any(set(selectors) <= source for source in written.get(selectors[0], [])):
+            unsafe.append(rule.selector)
+    return unsafe
+
+
+def _to_min_css(node):
+    if isinstance(node, CssRule):
+        return node.selector + node.body
+    head = f"@{node.name} {node.prelude}".rstrip() if node.prelude else f"@{node.name}"
+    if node.children is not None:
+        return head + '{' + ''.join(_to_min_css(child) for child in node.children) + '}'
+    return head + node.body if node.body else head + ';'
+
+
+def minify_nodes(nodes):
+    """Serialize a rule tree as minified CSS"""
+    return ''.join(_to_min_css(node) for node in collapse_rules(nodes))
+
+
+def compressed_sizes(text):
+    """Raw, gzip and (when the brotli package is installed) brotli sizes in bytes"""
+    raw = text.encode('utf-8')
+    return {
+        'raw': len(raw),
+        'gzip': len(gzip.compress(raw, compresslevel=9, mtime=0)),
+        'brotli': len(brotli.compress(raw)) if brotli else None,
+    }
+
+
+def format_sizes(sizes):
+    text = f"{sizes['raw']} raw, {sizes['gzip']} gzip"
+    if sizes['brotli'] is not None:
+        text += f", {sizes['brotli']} brotli"
+    return text
+
+
+def render_nodes(nodes, minify=True):
+    if minify:
+        return minify_nodes(nodes)
+    return '\n\n'.join(node.to_css() for node in nodes)
+
+
+def optimize_css(css_content, index, minify=True):
+    """Return ``css_content`` with rules unused by the theme removed, minified by default."""
+    nodes, _ = parse_css(css_content)
+    return render_nodes(prune_nodes(nodes, index), minify)
+
+
+def optimize_css_file(input_file, output_file, index, minify=True):
     """Remove unused CSS rules from a CSS file"""
-    
+
     with open(input_file, 'r', encoding='utf-8') as f:
         css_content = f.read()
-    
-    # Split CSS into rules
-    rules = []
-    current_rule = ""
-    brace_count = 0
-    
-    for char in css_content:
-        current_rule += char
-        if char == '{':
-            brace_count += 1
-        elif char == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                rules.append(current_rule.strip())
-                current_rule = ""
-    
-    # Add any remaining content
-    if current_rule.strip():
-        rules.append(current_rule.strip())
-    
-    # Keep essential rules and used classes
-    essential_patterns = [
-        r':root\s*{',  # CSS variables
-        r'@media',     # Media queries
-        r'@keyframes', # Animations
-        r'html\s*{',   # HTML element
-        r'body\s*{',   # Body element
-        r'\*\s*{',     # Universal selector
-        r'\.visually-hidden',  # Accessibility
-        r'\.skip-to-content',  # Accessibility
-        r'\.page-width',       # Layout
-        r'\.section',          # Layout sections
-    ]
-    
-    optimized_rules = []
-    
-    for rule in rules:
-        # Keep essential CSS
-        if any(re.search(pattern, rule, re.IGNORECASE) for pattern in essential_patterns):
-            optimized_rules.append(rule)
-            continue
-            
-        # Check if rule uses any classes we found in templates
-        rule_uses_known_class = False
-        
-        # Extract selectors from the rule
-        if '{' in rule:
-            selectors_part = rule.split('{')[0].strip()
-            
-            # Check for class selectors
-            class_selectors = re.findall(r'\.([a-zA-Z0-9_-]+)', selectors_part)
-            for class_name in class_selectors:
-                if class_name in used_classes:
-                    rule_uses_known_class = True
-                    break
-            
-            # Check for ID selectors
-            id_selectors = re.findall(r'#([a-zA-Z0-9_-]+)', selectors_part)
-            for id_name in id_selectors:
-                if id_name in used_ids:
-                    rule_uses_known_class = True
-                    break
-        
-        if rule_uses_known_class:
-            optimized_rules.append(rule)
-    
+
+    optimized_css = optimize_css(css_content, index, minify)
+
     # Write optimized CSS
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n\n'.join(optimized_rules))
-    
-    original_size = len(css_content)
-    optimized_size = sum(len(rule) for rule in optimized_rules)
-    savings = original_size - optimized_size
-    
-    print(f"Original size: {original_size} bytes")
-    print(f"Optimized size: {optimized_size} bytes")
-    print(f"Savings: {savings} bytes ({savings/original_size*100:.1f}%)")
-    
+        f.write(optimized_css)
+
+    original = compressed_sizes(css_content)
+    optimized = compressed_sizes(optimized_css)
+    savings = original['raw'] - optimized['raw']
+
+    print(f"Original size: {format_sizes(original)} bytes")
+    print(f"Optimized size: {format_sizes(optimized)} bytes")
+    print(f"Savings: {savings} bytes ({savings/original['raw']*100:.1f}%), "
+          f"{original['gzip'] - optimized['gzip']} bytes over the wire (gzip)")
+
     return savings
 
-def main():
-    print("Scanning templates for used CSS classes...")
-    used_classes, used_ids = get_used_classes()
-    
-    print(f"Found {len(used_classes)} used classes and {len(used_ids)} used IDs")
-    
+# Selector index shared by pool workers; set once per process by the initializer
+# instead of being pickled with every task.
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _optimize_asset(task):
+    input_file, output_file, minify = task
+    with open(input_file, 'r', encoding='utf-8') as f:
+        css_content = f.read()
+    optimized_css = optimize_css(css_content, _worker_index, minify)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(optimized_css)
+    original_sizes = compressed_sizes(css_content)
+    optimized_sizes = compressed_sizes(optimized_css)
+    original_size = original_sizes['raw']
+    optimized_size = optimized_sizes['raw']
+    return {
+        'file': input_file,
+        'output': output_file,
+        'original_bytes': original_size,
+        'optimized_bytes': optimized_size,
+        'savings_bytes': original_size - optimized_size,
+        'savings_percent': round((original_size - optimized_size) / original_size * 100, 1) if original_size else 0.0,
+        'original_sizes': original_sizes,
+        'optimized_sizes': optimized_sizes,
+    }
+
+
+def _sum_sizes(results, key):
+    total = {'raw': 0, 'gzip': 0, 'brotli': 0 if brotli else None}
+    for result in results:
+        for name, size in result[key].items():
+            if size is not None:
+                total[name] += size
+    return total
+
+
+def optimize_all_css(index, output_dir, report_file, workers=None, minify=True, include_dead=False):
+    """Prune every referenced stylesheet in assets/ in parallel and write a JSON savings report
+
+    Stylesheets no live theme file links are listed as unreferenced instead of
+    optimized, unless ``include_dead``.
+    """
+    css_files = sorted(
+        str(path) for path in Path('assets').glob('*.css')
+        if not path.stem.endswith('-optimized')
+    )
+    unreferenced = []
+    if not include_dead:
+        live = get_render_graph().live_assets('.css')
+        unreferenced = [css_file for css_file in css_files if css_file not in live]
+        css_files = [css_file for css_file in css_files if css_file in live]
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(css_file, os.path.join(output_dir, os.path.basename(css_file)), minify) for css_file in css_files]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(index,),
+    ) as pool:
+        results = list(pool.map(_optimize_asset, tasks, chunksize=4))
+
+    original_total = sum(result['original_bytes'] for result in results)
+    optimized_total = sum(result['optimized_bytes'] for result in results)
+    report = {
+        'files': results,
+        'total': {
+            'files': len(results),
+            'original_bytes': original_total,
+            'optimized_bytes': optimized_total,
+            'savings_bytes': original_total - optimized_total,
+            'savings_percent': round((original_total - optimized_total) / original_total * 100, 1) if original_total else 0.0,
+            'original_sizes': _sum_sizes(results, 'original_sizes'),
+            'optimized_sizes': _sum_sizes(results, 'optimized_sizes'),
+        },
+        'unreferenced': [{'file': css_file, 'bytes': os.path.getsize(css_file)} for css_file in unreferenced],
+    }
+
+    report_dir = os.path.dirname(report_file)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for result in sorted(results, key=lambda item: item['savings_bytes'], reverse=True)[:10]:
+        print(f"  {result['file']}: -{result['savings_bytes']} bytes ({result['savings_percent']}%)")
+    total = report['total']
+    print(f"Optimized {total['files']} stylesheets: {total['original_bytes']} -> "
+          f"{total['optimized_bytes']} bytes ({total['savings_percent']}% saved)")
+    print(f"  before: {format_sizes(total['original_sizes'])}")
+    print(f"  after:  {format_sizes(total['optimized_sizes'])}")
+    if unreferenced:
+        print(f"Skipped {len(unreferenced)} stylesheets no live template links "
+              f"({sum(item['bytes'] for item in report['unreferenced'])} bytes), see the report")
+    print(f"Report written to {report_file}")
+    return report
+
+
+# Roughly what fits in the first round trip (initial congestion window), in
+# compressed bytes as they travel over the wire
+CRITICAL_BUDGET_DEFAULT = 14 * 1024
+# Section groups rendered above the fold by the layout; the rest (footer, ...) are deferred
+ABOVE_FOLD_GROUPS = {'header-group'}
+# Snippets the layout renders closed or off-canvas, so they never need critical CSS
+OFF_CANVAS_SNIPPETS = {'cart-drawer'}
+
+
+def _rule_keys(nodes, context=()):
+    """(at-rule context, selector, body) for every selector in a pruned rule tree"""
+    keys = set()
+    for node in nodes:
+        if isinstance(node, CssRule):
+            keys.update((context, sel, node.body) for sel in split_selectors(node.selector))
+        elif node.children is not None:
+            keys |= _rule_keys(node.children, context + ((node.name, node.prelude),))
+        else:
+            keys.add((context, node.to_css(), None))
+    return keys
+
+
+def subtract_nodes(nodes, keys, context=()):
+    """Drop the selectors (and whole at-rules) already present in ``keys``"""
+    kept = []
+    for node in nodes:
+        if isinstance(node, CssRule):
+            selectors = [sel for sel in split_selectors(node.selector) if (context, sel, node.body) not in keys]
+            if selectors:
+                kept.append(CssRule(', '.join(selectors), node.body))
+        elif node.children is not None:
+            children = subtract_nodes(node.children, keys, context + ((node.name, node.prelude),))
+            if children:
+                kept.append(CssAtRule(node.name, node.prelude, children=children))
+        elif (context, node.to_css(), None) not in keys:
+            kept.append(node)
+    return kept
+
+
+def plan_template_css(template_file, above_fold_sections=1):
+    """Split a JSON template's files into above-the-fold and full render sets
+
+    Above the fold is the layout with its header group plus the markup of the
+    first ``above_fold_sections`` sections themselves. Snippets those sections
+    render (product cards, media galleries, ...) mostly paint further down, so
+    they are left to the deferred stylesheet.
+    """
+    data = parse_json_template(read_text(template_file)) or {}
+    roots = layout_roots(data)
+    section_files = [path for path in json_section_files(data) if path.startswith('sections/')]
+    return {
+        'above_fold': render_closure(roots, groups=ABOVE_FOLD_GROUPS, skip_snippets=OFF_CANVAS_SNIPPETS)
+                      + section_files[:above_fold_sections],
+        'full': render_closure(roots + [template_file]),
+        'sections': [os.path.basename(path)[:-len('.liquid')] for path in section_files],
+    }
+
+
+def extract_critical_css(entries, output_dir, report_file, budget=CRITICAL_BUDGET_DEFAULT, above_fold_sections=1,
+                         minify=True):
+    """Write a critical snippet and deferred stylesheet per JSON template
+
+    The critical part holds the rules whose classes and IDs are all used by the
+    layout, the header group and the first ``above_fold_sections`` sections of
+    the template, taken from the stylesheets those files link. The deferred part
+    holds every other rule the template's full render tree may use. Returns the
+    number of templates whose gzipped critical CSS exceeds ``budget`` bytes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    parsed = {}
+
+    def pruned(sheet, index, strict=False):
+        if sheet not in parsed:
+            parsed[sheet] = parse_css(read_text(sheet))[0]
+        return prune_nodes(parsed[sheet], index, strict)
+
+    results = []
+    for template_file in iter_json_templates():
+        name = template_name(template_file)
+        plan = plan_template_css(template_file, above_fold_sections)
+        above_index = usage_index_for(entries, plan['above_fold'])
+        full_index = usage_index_for(entries, plan['full'])
+
+        critical_nodes = []
+        for sheet in linked_assets(plan['above_fold'], '.css'):
+            critical_nodes.extend(pruned(sheet, above_index, strict=True))
+        critical_keys = _rule_keys(critical_nodes)
+        deferred_nodes = []
+        for sheet in linked_assets(plan['full'], '.css'):
+            remainder = subtract_nodes(pruned(sheet, full_index), critical_keys)
+            critical_keys |= _rule_keys(remainder)
+            deferred_nodes.extend(remainder)
+
+        critical_css = render_nodes(critical_nodes, minify)
+        deferred_css = render_nodes(deferred_nodes, minify)
+        snippet_file = os.path.join(output_dir, f"critical-css-{name}.liquid")
+        deferred_file = os.path.join(output_dir, f"{name}.deferred.css")
+        with open(snippet_file, 'w', encoding='utf-8') as f:
+            f.write(f'<style id="critical-css-{name}">\n{critical_css}\n</style>\n')
+        with open(deferred_file, 'w', encoding='utf-8') as f:
+            f.write(deferred_css)
+
+        critical_sizes = compressed_sizes(critical_css)
+        results.append({
+            'template': name,
+            'sections': plan['sections'],
+            'critical_file': snippet_file,
+            'deferred_file': deferred_file,
+            'critical_bytes': critical_sizes['raw'],
+            'critical_sizes': critical_sizes,
+            'deferred_bytes': len(deferred_css.encode('utf-8')),
+            'budget_bytes': budget,
+            'over_budget': critical_sizes['gzip'] > budget,
+        })
+
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump({'templates': results}, f, indent=2)
+
+    for result in results:
+        flag = '  OVER BUDGET' if result['over_budget'] else ''
+        print(f"  {result['template']}: critical {format_sizes(result['critical_sizes'])} bytes, "
+              f"deferred {result['deferred_bytes']} bytes{flag}")
+    over = sum(result['over_budget'] for result in results)
+    print(f"Wrote critical CSS for {len(results)} templates to {output_dir} "
+          f"({over} over the {budget} byte gzip budget)")
+    print(f"Report written to {report_file}")
+    return over
+
+
+
+def check_merges(stylesheets):
+    """Run each stylesheet through collapse_rules and report unsafe selector merges; returns the count"""
+    unsafe = 0
+    for sheet in stylesheets:
+        merges = unsafe_merges(parse_css(read_text(sheet))[0])
+        unsafe += len(merges)
+        for selector in merges:
+            print(f"  {sheet}: {selector}")
+    print(f"Checked {len(stylesheets)} stylesheets: {unsafe} unsafe selector merges")
+    return unsafe
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Remove unused CSS from the theme stylesheets.')
+    parser.add_argument('--all', action='store_true',
+                        help='Optimize every stylesheet in assets/ instead of only base.css')
+    parser.add_argument('--output-dir', default='build/optimized-css',
+                        help='Where --all writes optimized stylesheets')
+    parser.add_argument('--report', default='build/css-report.json',
+                        help='Where --all writes the JSON savings report')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for --all (default: CPU count)')
+    parser.add_argument('--no-minify', action='store_true',
+                        help='Write pruned CSS unminified (one rule per block) for debugging')
+    parser.add_argument('--critical', action='store_true',
+                        help='Emit critical and deferred CSS for every JSON template')
+    parser.add_argument('--critical-dir', default='build/critical-css',
+                        help='Where --critical writes snippets, deferred stylesheets and report.json')
+    parser.add_argument('--critical-budget', type=int, default=CRITICAL_BUDGET_DEFAULT,
+                        help='Maximum gzipped critical CSS bytes per template; exceeding it exits non-zero')
+    parser.add_argument('--above-fold', type=int, default=1,
+                        help='Template sections (after the header group) whose own markup is treated as above the fold')
+    parser.add_argument('--check-merges', nargs='*', metavar='CSS',
+                        help='Only check that minification keeps :focus-visible/:has()/... rules apart from '
+                             'their fallbacks (default: assets/base.css); exits non-zero on an unsafe merge')
+    parser.add_argument('--cache', default=CLASS_CACHE_FILE,
+                        help='Per-file class scan cache (keyed by content hash)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-scan every template file')
+    parser.add_argument('--include-dead', action='store_true',
+                        help='Also scan and optimize files the render graph cannot reach from a template')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and re-optimize when templates or stylesheets change')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Polling interval in seconds for --watch')
+    return parser
+
+
+def _watched_state():
+    """Snapshot of (mtime, size) for every input the optimizer depends on"""
+    paths = list(iter_source_files(include_dead=True))
+    paths.extend(
+        str(path) for path in Path('assets').glob('*.css')
+        if not path.stem.endswith('-optimized')
+    )
+    state = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        state[path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def watch(args):
+    """Poll the theme for changes and re-run the optimizer incrementally"""
+    print(f"Watching {', '.join(TEMPLATE_DIRS)}, assets/*.js and assets/*.css (Ctrl+C to stop)...")
+    state = _watched_state()
+    try:
+        while True:
+            time.sleep(args.interval)
+            current = _watched_state()
+            if current == state:
+                continue
+            changed = sorted(path for path in set(state) | set(current) if state.get(path) != current.get(path))
+            state = current
+            print(f"\nChanged: {', '.join(changed[:5])}{' ...' if len(changed) > 5 else ''}")
+            run(args)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    status = run(args)
+    if args.watch:
+        watch(args)
+    return status
+
+
+def run(args):
+    if args.check_merges is not None:
+        return 1 if check_merges(args.check_merges or ['assets/base.css']) else 0
+
+    print("Scanning templates, JSON templates and scripts for used CSS classes...")
+    # Rebuilt every run so --watch picks up newly rendered or removed sections
+    get_render_graph(refresh=True)
+    entries = scan_source_files(None if args.no_cache else args.cache, args.include_dead)
+    index = usage_index_for(entries)
+    used_classes = index.classes
+
+    print(f"Found {len(index.classes)} used classes and {len(index.ids)} used IDs "
+          f"({len(index.class_prefixes) + len(index.id_prefixes)} dynamic prefixes)")
+
+    if args.all:
+        print("Optimizing all stylesheets in assets/...")
+        optimize_all_css(index, args.output_dir, args.report, args.workers,
+                         minify=not args.no_minify, include_dead=args.include_dead)
+        return 0
+
+    if args.critical:
+        print("Extracting critical CSS per template...")
+        over_budget = extract_critical_css(
+            entries,
+            args.critical_dir,
+            os.path.join(args.critical_dir, 'report.json'),
+            budget=args.critical_budget,
+            above_fold_sections=args.above_fold,
+            minify=not args.no_minify,
+        )
+        return 1 if over_budget else 0
+
     # Optimize base.css
     if os.path.exists('assets/base.css'):
         print("Optimizing base.css...")
         savings = optimize_css_file(
             'assets/base.css', 
             'assets/base-optimized.css', 
-            used_classes, 
-            used_ids
+            index,
+            minify=not args.no_minify,
         )
         print(f"Created assets/base-optimized.css with {savings} bytes savings")
     
@@ -150,6 +1436,7 @@ def main():
     common_classes = sorted(used_classes)[:20]
     for cls in common_classes:
         print(f"  .{cls}")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+JavaScript usage analysis for the Shopify theme
+Companion to optimize-css.py: finds which scripts each template actually needs
+
+Every assets/*.js file is scanned for the custom elements it defines
+(customElements.define), the top-level names it declares and the names it
+uses from other scripts. Each JSON template's render tree (layout, section
+groups, sections, blocks and snippets) is scanned for the scripts it loads and
+the custom element tags it renders. A script is needed when it defines an
+element the template renders, is a dependency of a needed script, or defines
+no custom elements at all (side-effect scripts are kept as they are). When a
+needed script is only a subset of another (global-critical.js of global.js),
+the one the template loads is kept: a larger script it does not load is listed
+under superset_alternatives, with the globals and elements only that script
+would provide under missing_globals/missing_elements. Otherwise the subset is
+reported as subsumed and left out of the bundle.
+
+Usage:
+    python scripts/optimize-js.py            # report -> build/js-report.json
+    python scripts/optimize-js.py --bundles  # also write build/js-bundles/<template>.js
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from theme_graph import (
+    get_render_graph,
+    iter_json_templates,
+    linked_assets,
+    read_text,
+    template_closure,
+    template_name,
+)
+
+_JS_SKIP_RE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`', re.S)
+_DEFINE_RE = re.compile(r'customElements\.define\(\s*[\'"]([a-z][\w-]*-[\w-]*)[\'"]\s*,\s*(class\b|[A-Za-z_$][\w$]*)')
+_TOP_LEVEL_RE = re.compile(
+    r'^(?:async\s+)?(?:class|function\*?)\s+([A-Za-z_$][\w$]*)|^(?:const|let|var)\s+([A-Za-z_$][\w$]*)'
+    r'|^window\.([A-Za-z_$][\w$]*)\s*=',
+    re.M,
+)
+# Free identifiers only: skip property accesses (``el.attributes``) and object keys (``selectors:``)
+_IDENTIFIER_RE = re.compile(r'(?<![.\w$])([A-Za-z_$][\w$]*)(?!\s*:(?!:))')
+_LEXICAL_RE = re.compile(r'^(?:class|const|let)\s+([A-Za-z_$][\w$]*)', re.M)
+_DECLARATION_RE = re.compile(r'\b(?:const|let|var|function|class)\s+([A-Za-z_$][\w$]*)')
+_JS_TAG_RE = re.compile(r'<([a-z][a-z0-9]*-[a-z0-9-]*)|createElement\(\s*[\'"`]([a-z][a-z0-9]*-[a-z0-9-]*)')
+_LIQUID_TAG_RE = re.compile(r'<([a-z][a-z0-9]*-[a-z0-9-]*)[\s>/]')
+
+
+class JsModule:
+    """What one script defines and references"""
+
+    def __init__(self, path, content):
+        self.path = path
+        self.bytes = len(content.encode('utf-8'))
+        code = _JS_SKIP_RE.sub(lambda match: ' ' * len(match.group()), content)
+        self.elements = {}
+        for match in _DEFINE_RE.finditer(content):
+            tag, class_name = match.groups()
+            self.elements[tag] = _definition_bytes(content, code, match, class_name)
+        self.names = {name for groups in _TOP_LEVEL_RE.findall(code) for name in groups if name}
+        # class/const/let globals throw when two classic scripts declare the same one
+        self.lexical_names = set(_LEXICAL_RE.findall(code))
+        # Names declared anywhere in the file (locals included) never refer to another script
+        self.identifiers = set(_IDENTIFIER_RE.findall(code)) - set(_DECLARATION_RE.findall(code))
+        self.rendered_tags = {tag for groups in _JS_TAG_RE.findall(content) for tag in groups if tag}
+
+
+def _matching_brace(code, pos):
+    depth = 0
+    for index in range(pos, len(code)):
+        if code[index] in '{(':
+            depth += 1
+        elif code[index] in '})':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(code)
+
+
+def _definition_bytes(content, code, match, class_name):
+    """Approximate size of the code behind one custom element definition"""
+    if class_name == 'class':
+        # customElements.define('x-y', class extends HTMLElement { ... })
+        start = match.start()
+        end = _matching_brace(code, code.index('(', start))
+    else:
+        declaration = re.search(r'\bclass\s+' + re.escape(class_name) + r'\b', code)
+        if not declaration:
+            return 0
+        start = declaration.start()
+        end = _matching_brace(code, code.index('{', declaration.end()))
+    return len(content[start:end].encode('utf-8'))
+
+
+def load_modules(script_dir='assets', include_dead=False):
+    """Parse every script a live theme file loads (every script with ``include_dead``)"""
+    live = None if include_dead else get_render_graph().live_assets('.js')
+    modules = {}
+    for path in sorted(Path(script_dir).glob('*.js')):
+        if live is None or str(path) in live:
+            modules[str(path)] = JsModule(str(path), read_text(path))
+    return modules
+
+
+def dependency_graph(modules):
+    """Map each script to ``{name: scripts declaring it}`` for the globals it uses
+
+    Several scripts can declare the same helper (``debounce`` lives in
+    global.js, global-critical.js and facets.js); which one satisfies the
+    dependency is decided per template.
+    """
+    owners = {}
+    for path, module in modules.items():
+        for name in module.names:
+            owners.setdefault(name, set()).add(path)
+    graph = {}
+    for path, module in modules.items():
+        graph[path] = {
+            name: owners[name] for name in sorted(module.identifiers - module.names)
+            if name in owners and path not in owners[name]
+        }
+    return graph
+
+
+def _dependency_closure(paths, graph, modules, loaded, exclude=frozenset(), missing=None):
+    """Add the scripts providing every global the given scripts use
+
+    A name already provided by a needed script adds nothing; otherwise the
+    provider the template loads first wins, then the smallest one. Scripts in
+    ``exclude`` are never added; a name only they provide is recorded in
+    ``missing`` as ``{name: {scripts using it}}``.
+    """
+    rank = {path: index for index, path in enumerate(loaded)}
+    needed = set()
+    pending = list(paths)
+    while pending:
+        path = pending.pop(0)
+        if path in needed:
+            continue
+        needed.add(path)
+        for name, owners in graph.get(path, {}).items():
+            owners = owners - exclude
+            if owners & needed:
+                continue
+            if not owners:
+                if missing is not None:
+                    missing.setdefault(name, set()).add(path)
+                continue
+            provider = min(owners, key=lambda owner: (rank.get(owner, len(rank)), modules[owner].bytes))
+            pending.append(provider)
+    return needed
+
+
+def _direct_dependencies(path, graph, paths):
+    deps = set()
+    for owners in graph.get(path, {}).values():
+        deps |= owners & paths
+    return deps
+
+
+def _bundle_order(paths, graph, load_order):
+    """Dependencies first; otherwise keep the order the theme loads scripts in"""
+    rank = {path: index for index, path in enumerate(load_order)}
+    ordered, visiting = [], set()
+
+    def visit(path):
+        if path in ordered or path in visiting:
+            return
+        visiting.add(path)
+        for dep in sorted(_direct_dependencies(path, graph, paths), key=lambda item: rank.get(item, len(rank))):
+            visit(dep)
+        ordered.append(path)
+
+    for path in sorted(paths, key=lambda item: (rank.get(item, len(rank)), item)):
+        visit(path)
+    return ordered
+
+
+def _covers(module, other):
+    """True when ``module`` declares every global and element ``other`` does, and more"""
+    return (other.names <= module.names
+            and set(other.elements) <= set(module.elements)
+            and (other.names, set(other.elements)) != (module.names, set(module.elements)))
+
+
+def _needed_scripts(tags, loaded, modules, graph, definers, exclude=frozenset()):
+    """Scripts needed for ``tags``: their definers, side-effect scripts and dependencies
+
+    Elements rendered from needed scripts (innerHTML templates, createElement)
+    are needed too. Returns the scripts, the grown tag set and the globals only
+    ``exclude`` scripts provide.
+    """
+    tags = set(tags)
+    needed = set()
+    while True:
+        missing = {}
+        roots = {path for tag in tags for path in definers.get(tag, ()) if path not in exclude}
+        roots |= {path for path in loaded if not modules[path].elements and path not in exclude}
+        closure = _dependency_closure(sorted(roots, key=lambda path: (path not in loaded, path)),
+                                      graph, modules, loaded, exclude, missing)
+        new_tags = {tag for path in closure for tag in modules[path].rendered_tags} - tags
+        if closure == needed and not new_tags:
+            return needed, tags, missing
+        needed = closure
+        tags |= new_tags
+
+
+def analyze_template(template_file, modules, graph):
+    files = template_closure(template_file)
+    loaded = linked_assets(files, '.js')
+    tags = set()
+    for path in files:
+        if path.endswith('.liquid'):
+            tags.update(_LIQUID_TAG_RE.findall(read_text(path)))
+
+    definers = {}
+    for path, module in modules.items():
+        for tag in module.elements:
+            definers.setdefault(tag, set()).add(path)
+
+    needed, tags, _ = _needed_scripts(tags, loaded, modules, graph, definers)
+
+    # The layout loads global-critical.js, not the global.js it is a subset of.
+    # When a needed superset is not loaded but its loaded subset is, keep the
+    # subset and report the superset as an alternative, along with the globals
+    # (and elements) only the superset would provide.
+    alternatives = {}
+    for path in sorted(needed):
+        if path in loaded and modules[path].names:
+            for other in sorted(needed - set(loaded)):
+                if _covers(modules[other], modules[path]):
+                    alternatives[path] = other
+                    break
+    missing_globals = {}
+    if alternatives:
+        needed, tags, missing = _needed_scripts(tags, loaded, modules, graph, definers,
+                                                exclude=frozenset(alternatives.values()))
+        missing_globals = {name: sorted(users) for name, users in sorted(missing.items())}
+    missing_elements = sorted(
+        tag for tag in tags if tag in definers and not definers[tag] & needed
+    )
+
+    # A script whose globals and elements another needed script also provides
+    # (both loaded, or neither) is dropped in favour of the larger one
+    subsumed = sorted(
+        path for path in needed
+        if modules[path].names and any(
+            other != path
+            and _covers(modules[other], modules[path])
+            for other in needed
+        )
+    )
+    needed -= set(subsumed)
+    declared = {}
+    for path in needed:
+        for name in modules[path].lexical_names:
+            declared.setdefault(name, []).append(path)
+    redeclared = {name: sorted(paths) for name, paths in sorted(declared.items()) if len(paths) > 1}
+
+    unused_loaded = [path for path in loaded if path not in needed]
+    missing = sorted(path for path in needed if path not in loaded)
+    unused_elements = {
+        path: sorted(tag for tag in modules[path].elements if tag not in tags)
+        for path in loaded if path in needed
+    }
+    unused_element_bytes = sum(
+        modules[path].elements[tag] for path, element_tags in unused_elements.items() for tag in element_tags
+    )
+    return {
+        'template': template_name(template_file),
+        'custom_elements': sorted(tag for tag in tags if tag in definers),
+        'loaded_scripts': loaded,
+        'needed_scripts': _bundle_order(needed, graph, loaded),
+        'unused_scripts': unused_loaded,
+        'subsumed_scripts': subsumed,
+        'superset_alternatives': alternatives,
+        'missing_globals': missing_globals,
+        'missing_elements': missing_elements,
+        'redeclared_globals': redeclared,
+        'not_loaded_by_template': missing,
+        'unused_elements': {path: tags_ for path, tags_ in unused_elements.items() if tags_},
+        'loaded_bytes': sum(modules[path].bytes for path in loaded),
+        'needed_bytes': sum(modules[path].bytes for path in needed),
+        'unused_script_bytes': sum(modules[path].bytes for path in unused_loaded),
+        'unused_element_bytes': unused_element_bytes,
+    }
+
+
+def write_bundle(result, output_dir):
+    bundle_file = os.path.join(output_dir, f"{result['template']}.js")
+    with open(bundle_file, 'w', encoding='utf-8') as f:
+        for path in result['needed_scripts']:
+            f.write(f"/* {path} */\n")
+            f.write(read_text(path).rstrip())
+            f.write('\n;\n')
+    return bundle_file
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Report which theme scripts each template actually needs.')
+    parser.add_argument('--report', default='build/js-report.json',
+                        help='Where to write the JSON usage report')
+    parser.add_argument('--bundles', action='store_true',
+                        help='Write one concatenated bundle of the needed scripts per template')
+    parser.add_argument('--include-dead', action='store_true',
+                        help='Also analyze scripts no live theme file loads')
+    parser.add_argument('--bundle-dir', default='build/js-bundles',
+                        help='Where --bundles writes per-template scripts')
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    print("Scanning assets/*.js for custom elements and dependencies...")
+    modules = load_modules(include_dead=args.include_dead)
+    graph = dependency_graph(modules)
+    defined = sum(len(module.elements) for module in modules.values())
+    print(f"Found {len(modules)} scripts defining {defined} custom elements")
+
+    results = [analyze_template(template_file, modules, graph) for template_file in iter_json_templates()]
+    if args.bundles:
+        os.makedirs(args.bundle_dir, exist_ok=True)
+        for result in results:
+            if result['redeclared_globals']:
+                # Concatenated, these scripts would throw on the duplicate class/const/let
+                print(f"  skipping bundle for {result['template']}: "
+                      f"{', '.join(result['redeclared_globals'])} declared by more than one script")
+                continue
+            result['bundle'] = write_bundle(result, args.bundle_dir)
+
+    used_anywhere = {path for result in results for path in result['needed_scripts']}
+    report = {
+        'templates': results,
+        'scripts': {
+            path: {
+                'bytes': module.bytes,
+                'custom_elements': sorted(module.elements),
+                'depends_on': sorted({owner for owners in graph[path].values() for owner in owners}),
+                'needed_by': [result['template'] for result in results if path in result['needed_scripts']],
+            }
+            for path, module in modules.items()
+        },
+        'never_needed': sorted(set(modules) - used_anywhere),
+        'unreferenced': sorted(str(path) for path in Path('assets').glob('*.js') if str(path) not in modules),
+    }
+    report_dir = os.path.dirname(args.report)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        print(f"  {result['template']}: loads {len(result['loaded_scripts'])} scripts "
+              f"({result['loaded_bytes']} bytes), needs {len(result['needed_scripts'])} "
+              f"({result['needed_bytes']} bytes); {result['unused_script_bytes']} bytes in unused scripts, "
+              f"{result['unused_element_bytes']} bytes of unused elements")
+        if result['missing_globals'] or result['missing_elements']:
+            print(f"    missing without {', '.join(sorted(set(result['superset_alternatives'].values())))}: "
+                  f"{', '.join(list(result['missing_globals']) + result['missing_elements'])}")
+    print(f"Scripts no template needs: {', '.join(report['never_needed']) or 'none'}")
+    if report['unreferenced']:
+        print(f"Scripts no live theme file loads (skipped): {', '.join(report['unreferenced'])}")
+    print(f"Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Render graph of the Shopify theme, shared by the optimizer scripts
+
+Every layout, template, section, section group, snippet and theme block is a
+node; edges come from {% render %}/{% include %}/{% section %}/{% sections %}
+and {% content_for 'block' %} tags, from the sections and blocks listed in JSON
+templates and section groups, and from a template's layout. Asset references
+('x.css' | asset_url, ...) are recorded per file. Edges are cached per file by
+content hash, so rebuilding the graph only re-reads files that changed.
+
+Sections a live script requests through the Section Rendering API
+(``sections: 'cart-icon-bubble'``) are live as well. ``{% render block %}``
+and sections a merchant can add from the theme editor cannot be resolved
+statically, so an unreachable file is a candidate for removal, not proof.
+
+Imported by optimize-css.py and optimize-js.py (scripts/ is on sys.path when
+they run) so both only consider live code; run directly it reports the
+sections, snippets, blocks and assets nothing reaches.
+
+Usage:
+    python scripts/theme_graph.py   # unreachable files -> build/render-graph-report.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+GRAPH_CACHE_FILE = 'build/.render-graph-cache.json'
+# Bump when edge extraction changes so stale cache entries are discarded
+GRAPH_CACHE_VERSION = 1
+THEME_DIRS = ['layout', 'templates', 'sections', 'snippets', 'blocks']
+# Directories whose .json files are templates or section groups
+JSON_DIRS = ['templates', 'sections']
+DEFAULT_LAYOUT = 'layout/theme.liquid'
+SCRIPT_DIR = 'assets'
+
+_RENDER_TAG_RE = re.compile(r'\b(?:render|include)\s+[\'"]([\w.-]+)[\'"]')
+_SECTION_TAG_RE = re.compile(r'\bsection\s+[\'"]([\w.-]+)[\'"]')
+_SECTIONS_TAG_RE = re.compile(r'\bsections\s+[\'"]([\w.-]+)[\'"]')
+_STATIC_BLOCK_RE = re.compile(r'\bcontent_for\s+[\'"]block[\'"]\s*,\s*type:\s*[\'"]([\w.-]+)[\'"]')
+_LAYOUT_TAG_RE = re.compile(r'{%-?\s*layout\s+(?:[\'"]([\w.-]+)[\'"]|(none))')
+_ASSET_REF_RE = re.compile(r'[\'"]([\w.-]+\.(?:css|js))[\'"]')
+# Section Rendering API: scripts fetch sections by name (``sections: 'cart-icon-bubble'``)
+_JS_SECTION_NAME_RE = re.compile(r'[\'"`]([a-z][\w-]*)[\'"`]')
+_EDGE_PATTERNS = (
+    (_RENDER_TAG_RE, 'snippets/{}.liquid'),
+    (_SECTION_TAG_RE, 'sections/{}.liquid'),
+    (_SECTIONS_TAG_RE, 'sections/{}.json'),
+    (_STATIC_BLOCK_RE, 'blocks/{}.liquid'),
+)
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def parse_json_template(content):
+    """Parse a JSON template or section group, skipping Shopify's leading comment banner"""
+    body = content.lstrip()
+    if body.startswith('/*'):
+        body = body[body.find('*/') + 2:]
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def iter_json_templates():
+    for path in sorted(Path('templates').rglob('*.json')):
+        yield str(path)
+
+
+def template_name(template_file):
+    """``templates/customers/login.json`` -> ``customers.login``"""
+    return os.path.relpath(template_file, 'templates')[:-len('.json')].replace(os.sep, '.')
+
+
+def layout_roots(data):
+    """The layout file a parsed JSON template renders inside (none for ``"layout": false``)"""
+    layout = data.get('layout', 'theme')
+    return [f"layout/{layout}.liquid"] if layout else []
+
+
+def json_section_files(data):
+    """Section (and theme block) files a JSON template or section group renders, in order"""
+    files = []
+    sections = data.get('sections', {})
+    for key in data.get('order', list(sections)):
+        section = sections.get(key)
+        if not section or section.get('disabled'):
+            continue
+        files.append(f"sections/{section['type']}.liquid")
+        pending = list(section.get('blocks', {}).values())
+        while pending:
+            block = pending.pop(0)
+            block_file = f"blocks/{block.get('type')}.liquid"
+            if os.path.exists(block_file) and not block.get('disabled'):
+                files.append(block_file)
+            pending.extend(block.get('blocks', {}).values())
+    return files
+
+
+def iter_theme_files():
+    """Scripts (for their section requests), then every Liquid file and JSON template/group"""
+    for path in sorted(Path(SCRIPT_DIR).glob('*.js')):
+        yield str(path)
+    for dir_name in THEME_DIRS:
+        if os.path.exists(dir_name):
+            for root, dirs, files in os.walk(dir_name):
+                for file in sorted(files):
+                    if file.endswith('.liquid') or (file.endswith('.json') and dir_name in JSON_DIRS):
+                        yield os.path.join(root, file)
+
+
+def extract_edges(path, content):
+    """Files rendered by one theme file (in render order) and the assets it references"""
+    if path.endswith('.js'):
+        # Candidate section names only; names without a sections/ file are ignored
+        names = dict.fromkeys(_JS_SECTION_NAME_RE.findall(content))
+        return {'renders': [f"sections/{name}.liquid" for name in names], 'assets': []}
+    if path.endswith('.json'):
+        data = parse_json_template(content) or {}
+        renders = json_section_files(data)
+        if path.startswith('templates'):
+            renders = layout_roots(data) + renders
+        return {'renders': renders, 'assets': []}
+
+    renders = []
+    if path.startswith('templates'):
+        layout = _LAYOUT_TAG_RE.search(content)
+        if not layout:
+            renders.append(DEFAULT_LAYOUT)
+        elif layout.group(1):
+            renders.append(f"layout/{layout.group(1)}.liquid")
+    found = []
+    for pattern, target in _EDGE_PATTERNS:
+        found.extend((match.start(), target.format(match.group(1))) for match in pattern.finditer(content))
+    renders.extend(target for _, target in sorted(found))
+    return {'renders': renders, 'assets': _ASSET_REF_RE.findall(content)}
+
+
+class RenderGraph:
+    """Per-file render edges and asset references for the whole theme"""
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    def roots(self):
+        """Templates are what Shopify renders; the layout they use is an edge"""
+        return [path for path in self.edges if path.startswith('templates' + os.sep)]
+
+    def closure(self, roots, groups=None, skip_snippets=()):
+        """Every file reached from ``roots``, in breadth-first render order
+
+        ``groups`` limits which ``{% sections %}`` groups are followed from Liquid
+        (None follows all) and ``skip_snippets`` names snippets not to descend into.
+        """
+        seen = []
+        pending = list(roots)
+        while pending:
+            path = pending.pop(0)
+            if path in seen or path not in self.edges:
+                continue
+            seen.append(path)
+            for target in self.edges[path]['renders']:
+                if target.startswith('snippets/') and target[len('snippets/'):-len('.liquid')] in skip_snippets:
+                    continue
+                if (groups is not None and path.endswith('.liquid') and target.startswith('sections/')
+                        and target.endswith('.json') and target[len('sections/'):-len('.json')] not in groups):
+                    continue
+                pending.append(target)
+        return seen
+
+    def reachable(self):
+        """Theme files reached from a template, or through a live script's section requests"""
+        live = set()
+        roots = self.roots()
+        while True:
+            live |= set(self.closure(roots))
+            scripts = self._assets_of(live, '.js')
+            roots = [target for script in scripts for target in self.edges.get(script, {}).get('renders', [])
+                     if target in self.edges and target not in live]
+            if not roots:
+                return live
+
+    def unreachable(self):
+        live = self.reachable()
+        return sorted(path for path in self.edges if path not in live and not path.startswith(SCRIPT_DIR + os.sep))
+
+    def _assets_of(self, paths, extension=None):
+        assets = set()
+        for path in paths:
+            for name in self.edges[path]['assets']:
+                if extension is None or name.endswith(extension):
+                    assets.add(os.path.join(SCRIPT_DIR, name))
+        return {asset for asset in assets if os.path.exists(asset)}
+
+    def live_assets(self, extension=None):
+        """assets/* files referenced from reachable theme files"""
+        return self._assets_of(self.reachable(), extension)
+
+
+def _load_graph_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != GRAPH_CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def load_render_graph(cache_file=GRAPH_CACHE_FILE):
+    """Build the RenderGraph, re-reading only files whose size, mtime and hash changed"""
+    cached = _load_graph_cache(cache_file) if cache_file else {}
+    entries = {}
+    for path in iter_theme_files():
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if not (entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+            if not (entry and entry['hash'] == digest):
+                entry = dict(extract_edges(path, raw.decode('utf-8')), hash=digest)
+            entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        entries[path] = entry
+
+    if cache_file:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump({'version': GRAPH_CACHE_VERSION, 'files': entries}, f)
+    return RenderGraph(entries)
+
+
+_graph = None
+
+
+def get_render_graph(refresh=False):
+    """The process-wide RenderGraph, built (from the disk cache) on first use or ``refresh``"""
+    global _graph
+    if _graph is None or refresh:
+        _graph = load_render_graph()
+    return _graph
+
+
+def render_closure(roots, groups=None, skip_snippets=()):
+    """Every file reached from ``roots`` through the render graph, see RenderGraph.closure"""
+    return get_render_graph().closure(roots, groups, skip_snippets)
+
+
+def template_closure(template_file):
+    """Every file a JSON template renders, layout and section groups included"""
+    return render_closure([template_file])
+
+
+def linked_assets(paths, extension):
+    """assets/* files with ``extension`` referenced from the given theme files, in first-seen order"""
+    graph = get_render_graph()
+    assets = []
+    for path in paths:
+        for name in graph.edges.get(path, {}).get('assets', []):
+            asset = os.path.join('assets', name)
+            if name.endswith(extension) and asset not in assets and os.path.exists(asset):
+                assets.append(asset)
+    return assets
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Report theme files and assets no template reaches.')
+    parser.add_argument('--report', default='build/render-graph-report.json',
+                        help='Where to write the JSON report')
+    parser.add_argument('--cache', default=GRAPH_CACHE_FILE,
+                        help='Per-file render edge cache (keyed by content hash)')
+    return parser
+
+
+def main(argv=None):
+    global _graph
+    args = build_arg_parser().parse_args(argv)
+    _graph = load_render_graph(args.cache)
+
+    dead = _graph.unreachable()
+    theme_files = [path for path in _graph.edges if not path.startswith(SCRIPT_DIR + os.sep)]
+    live_assets = _graph.live_assets()
+    dead_assets = sorted(
+        str(path) for path in Path('assets').glob('*')
+        if path.suffix in ('.css', '.js') and str(path) not in live_assets
+    )
+    report = {
+        'files': len(theme_files),
+        'reachable': len(theme_files) - len(dead),
+        'unreachable': [{'file': path, 'bytes': os.path.getsize(path)} for path in dead],
+        'unreferenced_assets': [{'file': path, 'bytes': os.path.getsize(path)} for path in dead_assets],
+    }
+    report_dir = os.path.dirname(args.report)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['reachable']} of {report['files']} theme files are reachable from templates/")
+    for kind, items in (('Unreachable', report['unreachable']), ('Unreferenced assets', report['unreferenced_assets'])):
+        print(f"{kind}: {len(items)} files, {sum(item['bytes'] for item in items)} bytes")
+        for item in items:
+            print(f"  {item['file']} ({item['bytes']} bytes)")
+    print(f"Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,23 +13,75 @@ Usage example:
 Environment variables SHOPIFY_STORE_DOMAIN and SHOPIFY_ACCESS_TOKEN can be used
 instead of command-line arguments. Use --dry-run to preview the changes without
 calling the Shopify Admin API.
+
+Planned changes are applied in batches of --batch-size variants, each batch
+sent as a single GraphQL document of inventoryBulkToggleActivation,
+inventorySetQuantities and productVariantsBulkUpdate mutations. Pass
+--batch-size 0 to fall back to the per-variant REST calls.
+
+All Admin API calls share a leaky-bucket rate limiter fed by the
+X-Shopify-Shop-Api-Call-Limit header and GraphQL throttleStatus, and are
+retried with jittered backoff on 429, 5xx and THROTTLED responses. Use
+--concurrency N to apply variants (or batches) from N worker threads that share
+that budget and a connection pool of the same size.
+
+Progress (the last fully applied page cursor and every applied variant GID) is
+appended to --state-file; rerun with --resume to continue an interrupted
+migration without re-planning finished pages or re-applying finished variants.
+
+Discovery and writes can be split into two steps. The "plan" subcommand
+writes a sorted JSONL action plan (one PlannedAction record per line) and
+"apply" streams such a file into the executor, dropping redundant actions:
+
+    python scripts/update_inkthreadable_inventory.py plan --plan-output plan.jsonl
+    python scripts/update_inkthreadable_inventory.py apply plan.jsonl
+
+Plans can also be computed offline from snapshot/kulkid_live_dump.json:
+
+    python scripts/update_inkthreadable_inventory.py \
+        --from-snapshot snapshot/kulkid_live_dump.json \
+        --locations-fixture locations.json plan --plan-output plan.jsonl
+
+The locations fixture uses the shape of the REST locations.json response and
+may add "inventory_levels" (as returned by inventory_levels.json) and a
+"default_location" name that holds a variant's whole inventory_quantity when
+no levels are listed for it. Without one, such variants stop the plan with an
+error unless --target-location is given explicitly, in which case their
+quantity is placed there. No network calls are made in this mode.
+
+Store locations are cached in --locations-cache for --locations-cache-ttl
+seconds (0 disables the cache) so repeated runs skip the locations request.
+
+Large catalogs can be discovered with --bulk, which runs the product query as
+a Shopify bulk operation and streams the resulting JSONL file instead of
+paging through products 50 at a time.
 """
 from __future__ import annotations
 
 import argparse
 import base64
+import json
 import logging
+import math
 import os
+import random
 import sys
-from dataclasses import dataclass
-from typing import Dict, Iterator, List, Optional, Sequence
+import threading
+import time
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 API_VERSION_DEFAULT = "2023-10"
 DEFAULT_QUERY = "vendor:Inkthreadable OR vendor:Spreadconnect"
 DEFAULT_TARGET_LOCATION = "Lille Bislett 16"
+TARGET_QUANTITY = 999
 DEFAULT_SOURCE_LOCATIONS = (
     "Multiple locations",
     "Inkthreadable Warehouse",
@@ -37,9 +89,37 @@ DEFAULT_SOURCE_LOCATIONS = (
 )
 GRAPHQL_ENDPOINT = "admin/api/{version}/graphql.json"
 REST_ENDPOINT = "admin/api/{version}/{path}"
-
-
-@dataclass
+BULK_POLL_INTERVAL_DEFAULT = 5.0
+BULK_TERMINAL_FAILURES = ("FAILED", "CANCELED", "EXPIRED")
+# Every aliased mutation costs 10 points and a single GraphQL document may not
+# exceed 1,000, so a batch of 25 variants (up to ~76 mutations) stays below it.
+BATCH_SIZE_DEFAULT = 25
+# Standard-plan Admin API limits; both buckets resync from response metadata.
+REST_BUCKET_SIZE = 40
+REST_LEAK_RATE = 2.0
+GRAPHQL_BUCKET_SIZE = 1000.0
+GRAPHQL_RESTORE_RATE = 50.0
+GRAPHQL_COST_ESTIMATE = 50.0
+MAX_RETRIES_DEFAULT = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+STATE_FILE_DEFAULT = ".inkthreadable-inventory-state.jsonl"
+# Shopify rejects any single query whose requested cost exceeds 1,000 points.
+QUERY_COST_TARGET = 900.0
+MAX_CONNECTION_PAGE = 250
+VARIANTS_FIRST_DEFAULT = 25
+LEVELS_FIRST_DEFAULT = 10
+NESTED_PAGE_SIZE = 100
+LOCATIONS_CACHE_DEFAULT = ".inkthreadable-locations-cache.json"
+LOCATIONS_CACHE_TTL_DEFAULT = 24 * 60 * 60
+
+# Thousands of these objects are created per run; slots keep them small and
+# attribute access fast where the interpreter supports it (3.10+).
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class InventoryLevel:
     """Represents an inventory level for a variant at a specific location."""
 
@@ -48,9 +128,12 @@ class InventoryLevel:
     available: int
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class VariantInventoryState:
-    """Snapshot of inventory information for a product variant."""
+    """Snapshot of inventory information for a product variant.
+
+    Numeric IDs are parsed from the GIDs once, at construction time.
+    """
 
     variant_gid: str
     sku: str
@@ -59,14 +142,358 @@ class VariantInventoryState:
     inventory_policy: str
     inventory_item_gid: str
     levels: List[InventoryLevel]
+    product_gid: str = ""
+    variant_id: str = field(init=False, repr=False, compare=False)
+    inventory_item_id: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.variant_id = gid_to_id(self.variant_gid)
+        self.inventory_item_id = gid_to_id(self.inventory_item_gid)
+
+
+class LeakyBucket:
+    """Client-side estimate of one Shopify leaky bucket.
+
+    ``reserve`` deducts the cost immediately, letting the estimate go into
+    debt, and returns how long the caller must sleep before sending. Callers
+    sharing a bucket therefore queue up behind each other instead of all
+    waking at the same moment.
+    """
+
+    def __init__(self, capacity: float, rate: float, margin: float = 0.0) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.margin = margin
+        self.available = capacity
+        self.in_flight = 0.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, cost: float) -> float:
+        self._refill(time.monotonic())
+        self.available -= cost
+        self.in_flight += cost
+        if self.available >= self.margin:
+            return 0.0
+        return (self.margin - self.available) / self.rate
+
+    def settle(
+        self,
+        cost: float,
+        available: Optional[float] = None,
+        capacity: Optional[float] = None,
+        rate: Optional[float] = None,
+    ) -> None:
+        self.in_flight = max(0.0, self.in_flight - cost)
+        if capacity:
+            self.capacity = capacity
+        if rate:
+            self.rate = rate
+        if available is not None:
+            # The server figure already includes this request; other reservations
+            # still in flight have not reached it yet.
+            self.available = available - self.in_flight
+            self.updated_at = time.monotonic()
+
+
+class ShopifyRateLimiter:
+    """Thread-safe pacing for REST and GraphQL Admin API calls."""
+
+    def __init__(
+        self,
+        rest_bucket_size: float = REST_BUCKET_SIZE,
+        rest_leak_rate: float = REST_LEAK_RATE,
+        graphql_bucket_size: float = GRAPHQL_BUCKET_SIZE,
+        graphql_restore_rate: float = GRAPHQL_RESTORE_RATE,
+    ) -> None:
+        self._lock = threading.Lock()
+        self.rest = LeakyBucket(rest_bucket_size, rest_leak_rate, margin=2)
+        self.graphql = LeakyBucket(graphql_bucket_size, graphql_restore_rate, margin=50)
+        self._graphql_costs: Dict[str, float] = {}
+
+    def acquire_rest(self) -> None:
+        with self._lock:
+            delay = self.rest.reserve(1)
+        if delay:
+            time.sleep(delay)
+
+    def observe_rest(self, response: requests.Response) -> None:
+        used, capacity = _parse_call_limit(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+        with self._lock:
+            if capacity:
+                self.rest.settle(1, available=capacity - used, capacity=capacity)
+            else:
+                self.rest.settle(1)
+
+    def acquire_graphql(self, operation: str) -> float:
+        """Reserve the expected cost of ``operation`` and return it."""
+
+        with self._lock:
+            cost = self._graphql_costs.get(operation, GRAPHQL_COST_ESTIMATE)
+            delay = self.graphql.reserve(cost)
+        if delay:
+            time.sleep(delay)
+        return cost
+
+    def observe_graphql(self, operation: str, reserved: float, payload: Dict[str, object]) -> None:
+        cost = (payload.get("extensions") or {}).get("cost") or {}
+        status = cost.get("throttleStatus") or {}
+        with self._lock:
+            if cost.get("requestedQueryCost") is not None:
+                self._graphql_costs[operation] = float(cost["requestedQueryCost"])
+            self.graphql.settle(
+                reserved,
+                available=status.get("currentlyAvailable"),
+                capacity=status.get("maximumAvailable"),
+                rate=status.get("restoreRate"),
+            )
+
+
+class BoundedWorkerPool:
+    """Runs callables on a thread pool while capping the amount of queued work.
+
+    At most two tasks per worker are outstanding, so variants streamed from
+    discovery are not all buffered in memory. With a single worker callables
+    run inline on the calling thread.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="inventory-apply"
+            )
+        self._futures: "set[Future]" = set()
+
+    def submit(self, fn: Callable[..., None], *args: object) -> None:
+        if self._executor is None:
+            fn(*args)
+            return
+        if len(self._futures) >= self.workers * 2:
+            self._drain(FIRST_COMPLETED)
+        self._futures.add(self._executor.submit(fn, *args))
+
+    def join(self) -> None:
+        """Block until every submitted task has finished."""
+
+        if self._executor is not None:
+            self._drain(ALL_COMPLETED)
+
+    def _drain(self, return_when: str) -> None:
+        done, self._futures = wait(self._futures, return_when=return_when)
+        for future in done:
+            future.result()
+
+    def __enter__(self) -> "BoundedWorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._executor is None:
+            return
+        if exc_type is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            return
+        try:
+            self._drain(ALL_COMPLETED)
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ProductPageTuner:
+    """Chooses connection sizes for ``FETCH_PRODUCTS_QUERY`` from observed costs.
+
+    Shopify prices a query by multiplying the ``first`` arguments of nested
+    connections, so the inner sizes matter most. ``levelsFirst`` is the number
+    of store locations (a variant cannot have more levels than that), and
+    ``variantsFirst`` tracks the 90th percentile of variants per product;
+    larger products are completed with follow-up queries. The product page
+    size then fills the remaining budget, using ``requestedQueryCost`` to
+    calibrate the local cost estimate.
+    """
+
+    def __init__(
+        self,
+        levels_first: int = LEVELS_FIRST_DEFAULT,
+        target_cost: float = QUERY_COST_TARGET,
+    ) -> None:
+        self.target_cost = target_cost
+        self.levels_first = _clamp(levels_first, 1, MAX_CONNECTION_PAGE)
+        self.variants_first = VARIANTS_FIRST_DEFAULT
+        self.calibration = 1.0
+        self._variant_counts: "deque[int]" = deque(maxlen=500)
+        self.products_first = self._products_for_budget()
+
+    def _variants_cost(self, variants_first: int) -> int:
+        # Objects cost one point; a connection costs two plus ``first`` times
+        # the cost of its node.
+        level = 2  # InventoryLevel + Location
+        levels = 2 + self.levels_first * level
+        variant = 2 + levels  # ProductVariant + InventoryItem
+        return 2 + variants_first * variant
+
+    def estimate_cost(self, products_first: int, variants_first: int) -> float:
+        product = 1 + self._variants_cost(variants_first)
+        return (2 + products_first * product) * self.calibration
+
+    def estimate_variant_page_cost(self, variants_first: int) -> float:
+        """Cost of one ``FETCH_PRODUCT_VARIANTS_QUERY`` page (a product and its variants)."""
+        return (1 + self._variants_cost(variants_first)) * self.calibration
+
+    def variant_page_size(self) -> int:
+        """Follow-up variant page size that keeps that query under ``target_cost``."""
+        overhead = self.estimate_variant_page_cost(0)
+        per_variant = self.estimate_variant_page_cost(1) - overhead
+        budget = self.target_cost - overhead
+        return _clamp(int(budget // per_variant) if per_variant > 0 else 1, 1, NESTED_PAGE_SIZE)
+
+    def _products_for_budget(self) -> int:
+        per_product = self.estimate_cost(1, self.variants_first) - self.estimate_cost(
+            0, self.variants_first
+        )
+        budget = self.target_cost - self.estimate_cost(0, self.variants_first)
+        return _clamp(int(budget // per_product) if per_product > 0 else 1, 1, MAX_CONNECTION_PAGE)
+
+    def variables(self) -> Dict[str, int]:
+        return {
+            "first": self.products_first,
+            "variantsFirst": self.variants_first,
+            "levelsFirst": self.levels_first,
+        }
+
+    def observe(self, variant_counts: Sequence[int], extensions: Optional[Dict[str, object]]) -> None:
+        cost = (extensions or {}).get("cost") or {}
+        requested = cost.get("requestedQueryCost")
+        if requested:
+            estimate = self.estimate_cost(self.products_first, self.variants_first) / self.calibration
+            self.calibration = float(requested) / estimate
+
+        self._variant_counts.extend(variant_counts)
+        if self._variant_counts:
+            ordered = sorted(self._variant_counts)
+            p90 = ordered[max(0, math.ceil(len(ordered) * 0.9) - 1)]
+            self.variants_first = _clamp(p90, 1, MAX_CONNECTION_PAGE)
+        self.products_first = self._products_for_budget()
+
+
+def _clamp(value: int, lower: int, upper: int) -> int:
+    return max(lower, min(upper, value))
+
+
+class MigrationCheckpoint:
+    """Append-only JSONL log of migration progress used by ``--resume``.
+
+    The first line identifies the run (query and locations) so a state file is
+    never resumed against different settings. Later lines record either a
+    products page cursor whose variants are all applied, or a batch of
+    applied variant GIDs.
+    """
+
+    def __init__(self, path: str, run_key: Dict[str, object]) -> None:
+        self.path = path
+        self.run_key = run_key
+        self.cursor: Optional[str] = None
+        self.applied: "set[str]" = set()
+        self._lock = threading.Lock()
+        self._handle = None
+
+    @classmethod
+    def open(cls, path: str, run_key: Dict[str, object], resume: bool) -> "MigrationCheckpoint":
+        checkpoint = cls(path, run_key)
+        if resume and os.path.exists(path):
+            checkpoint._load()
+            checkpoint._handle = open(path, "a", encoding="utf-8")
+        else:
+            checkpoint._handle = open(path, "w", encoding="utf-8")
+            checkpoint._write({"type": "run", **run_key})
+        return checkpoint
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a truncated final line; ignore it.
+                    logging.getLogger(__name__).warning(
+                        "Ignoring unreadable line %d in %s", line_number, self.path
+                    )
+                    continue
+                kind = record.pop("type", None)
+                if kind == "run" and record != self.run_key:
+                    raise RuntimeError(
+                        f"State file {self.path} belongs to a different run: {record}"
+                    )
+                if kind == "cursor":
+                    self.cursor = record["cursor"]
+                elif kind == "applied":
+                    self.applied.update(record["variants"])
+
+    def _write(self, record: Dict[str, object]) -> None:
+        with self._lock:
+            self._handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._handle.flush()
+
+    def record_cursor(self, cursor: str) -> None:
+        self.cursor = cursor
+        self._write({"type": "cursor", "cursor": cursor})
+
+    def record_applied(self, variant_gids: Iterable[str]) -> None:
+        variant_gids = list(variant_gids)
+        with self._lock:
+            self.applied.update(variant_gids)
+        self._write({"type": "applied", "variants": variant_gids})
 
-    @property
-    def variant_id(self) -> str:
-        return gid_to_id(self.variant_gid)
+    def complete(self) -> None:
+        """Close and remove the state file once the migration has finished."""
 
-    @property
-    def inventory_item_id(self) -> str:
-        return gid_to_id(self.inventory_item_gid)
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class LocationCache:
+    """JSON file caching store locations per store and API version for ``ttl`` seconds."""
+
+    def __init__(self, path: str, ttl: float = LOCATIONS_CACHE_TTL_DEFAULT) -> None:
+        self.path = path
+        self.ttl = ttl
+
+    def _read(self) -> Dict[str, object]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key: str) -> Optional[List[Dict[str, object]]]:
+        entry = self._read().get(key)
+        if not entry or time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        return entry.get("locations")
+
+    def store(self, key: str, locations: Sequence[Dict[str, object]]) -> None:
+        entries = self._read()
+        entries[key] = {
+            "fetched_at": time.time(),
+            "locations": [{"id": loc["id"], "name": loc["name"]} for loc in locations],
+        }
+        try:
+            with open(self.path, "w", encoding="utf-8") as handle:
+                json.dump(entries, handle, indent=2, ensure_ascii=False)
+        except OSError as exc:
+            logging.getLogger(__name__).warning("Could not write locations cache: %s", exc)
 
 
 class ShopifyInventoryUpdater:
@@ -78,6 +505,14 @@ class ShopifyInventoryUpdater:
         target_location: str,
         source_locations: Sequence[str],
         dry_run: bool = False,
+        bulk: bool = False,
+        bulk_poll_interval: float = BULK_POLL_INTERVAL_DEFAULT,
+        batch_size: int = BATCH_SIZE_DEFAULT,
+        rate_limiter: Optional[ShopifyRateLimiter] = None,
+        max_retries: int = MAX_RETRIES_DEFAULT,
+        concurrency: int = 1,
+        checkpoint: Optional[MigrationCheckpoint] = None,
+        location_cache: Optional[LocationCache] = None,
     ) -> None:
         self.session = session
         self.store_domain = store_domain
@@ -85,13 +520,213 @@ class ShopifyInventoryUpdater:
         self.target_location = target_location
         self.source_locations = tuple(source_locations)
         self.dry_run = dry_run
+        self.bulk = bulk
+        self.bulk_poll_interval = bulk_poll_interval
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or ShopifyRateLimiter()
+        self.max_retries = max_retries
+        self.concurrency = max(1, concurrency)
+        self.checkpoint = None if dry_run else checkpoint
+        self.location_cache = location_cache
+        self.requests_sent = 0
+        # Planning statistics: REST calls the previous always-connect-and-set
+        # planner would have made, and variants needing no writes at all.
+        self.calls_avoided = 0
+        self.variants_in_sync = 0
+        self.location_count = 0
+        self._stats_lock = threading.Lock()
         self.logger = logging.getLogger(self.__class__.__name__)
 
+        if self.concurrency > 1:
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.concurrency)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
     def run(self, product_query: Optional[str]) -> None:
-        locations = self._fetch_locations()
+        resolved = self._resolve_locations(self._fetch_locations())
+        if resolved is None:
+            return
+        target_location_id, source_location_ids = resolved
+
+        total_variants = 0
+        updated_variants = 0
+        skipped_variants = 0
+        started = time.monotonic()
+        requests_before = self.requests_sent
+
+        checkpoint = self.checkpoint
+        start_cursor = checkpoint.cursor if checkpoint else None
+        if checkpoint and (checkpoint.cursor or checkpoint.applied):
+            self.logger.info(
+                "Resuming from %s with %d variants already applied.",
+                "saved page cursor" if checkpoint.cursor else "the first page",
+                len(checkpoint.applied),
+            )
+
+        with BoundedWorkerPool(self.concurrency) as pool:
+            executor = self._create_executor(pool)
+
+            def on_page_complete(end_cursor: str) -> None:
+                # Only advance the saved cursor once everything planned from
+                # the finished page has actually been written to Shopify.
+                if checkpoint is None:
+                    return
+                if executor is not None:
+                    executor.flush()
+                pool.join()
+                checkpoint.record_cursor(end_cursor)
+
+            for state in self._iter_inkthreadable_variants(
+                product_query, start_cursor, on_page_complete
+            ):
+                total_variants += 1
+                if checkpoint and state.variant_gid in checkpoint.applied:
+                    skipped_variants += 1
+                    continue
+                actions = self._plan_actions(state, source_location_ids, target_location_id)
+                if not actions:
+                    continue
+
+                updated_variants += 1
+                self._dispatch(pool, executor, state, actions)
+
+            if executor is not None:
+                executor.flush()
+
+        self._log_throughput(total_variants, started, requests_before, executor)
+        self.logger.info(
+            "Processed %d variants; updated %d variants needing location changes.",
+            total_variants,
+            updated_variants,
+        )
+        self.log_planning_savings()
+        if skipped_variants:
+            self.logger.info("Skipped %d variants applied by a previous run.", skipped_variants)
+        if checkpoint is not None:
+            checkpoint.complete()
+
+    def log_planning_savings(self) -> None:
+        self.logger.info(
+            "Avoided %d no-op API calls; %d variants were already in sync.",
+            self.calls_avoided,
+            self.variants_in_sync,
+        )
+
+    def apply_plan(
+        self, plan: Iterable[Tuple[VariantInventoryState, Sequence["PlannedAction"]]]
+    ) -> None:
+        """Apply a precomputed plan (see ``read_plan``) without rediscovering variants."""
+
+        applied_variants = 0
+        skipped_variants = 0
+        started = time.monotonic()
+        requests_before = self.requests_sent
+        checkpoint = self.checkpoint
+
+        with BoundedWorkerPool(self.concurrency) as pool:
+            executor = self._create_executor(pool)
+            for state, actions in plan:
+                if checkpoint and state.variant_gid in checkpoint.applied:
+                    skipped_variants += 1
+                    continue
+                applied_variants += 1
+                self._dispatch(pool, executor, state, actions)
+
+            if executor is not None:
+                executor.flush()
+
+        self._log_throughput(applied_variants, started, requests_before, executor)
+        self.logger.info("Applied plan to %d variants.", applied_variants)
+        if skipped_variants:
+            self.logger.info("Skipped %d variants applied by a previous run.", skipped_variants)
+        if checkpoint is not None:
+            checkpoint.complete()
+
+    def plan_live(
+        self, product_query: Optional[str]
+    ) -> Iterator[Tuple[VariantInventoryState, List["PlannedAction"]]]:
+        """Discover variants through the Admin API and plan them without applying."""
+
+        yield from self.plan(
+            self._iter_inkthreadable_variants(product_query), self._fetch_locations()
+        )
+
+    def plan(
+        self,
+        states: Iterable[VariantInventoryState],
+        locations: Sequence[Dict[str, object]],
+    ) -> Iterator[Tuple[VariantInventoryState, List["PlannedAction"]]]:
+        """Plan actions for ``states`` without touching the network.
+
+        Yields only variants that need at least one action.
+        """
+
+        resolved = self._resolve_locations(locations)
+        if resolved is None:
+            return
+        target_location_id, source_location_ids = resolved
+        for state in states:
+            actions = self._plan_actions(state, source_location_ids, target_location_id)
+            if actions:
+                yield state, actions
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _create_executor(self, pool: BoundedWorkerPool) -> Optional["BatchedInventoryExecutor"]:
+        if self.batch_size > 0 and not self.dry_run:
+            return BatchedInventoryExecutor(self, self.batch_size, pool)
+        return None
+
+    def _dispatch(
+        self,
+        pool: BoundedWorkerPool,
+        executor: Optional["BatchedInventoryExecutor"],
+        state: VariantInventoryState,
+        actions: Sequence["PlannedAction"],
+    ) -> None:
+        # Each variant's actions stay in one task (or one batch), so their
+        # relative order is preserved whatever the worker count.
+        if executor is not None:
+            executor.submit(state, actions)
+        else:
+            pool.submit(self._apply_actions, state, actions)
+
+    def _log_throughput(
+        self,
+        variants: int,
+        started: float,
+        requests_before: int,
+        executor: Optional["BatchedInventoryExecutor"],
+    ) -> None:
+        if executor is not None:
+            self.logger.info(
+                "Applied changes with %d batched GraphQL requests.",
+                executor.requests_sent,
+            )
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        requests_made = self.requests_sent - requests_before
+        self.logger.info(
+            "Throughput: %d variants in %.1fs (%.1f variants/s), %d API requests "
+            "(%.1f requests/s) with %d worker(s).",
+            variants,
+            elapsed,
+            variants / elapsed,
+            requests_made,
+            requests_made / elapsed,
+            self.concurrency,
+        )
+
+    def _resolve_locations(
+        self, locations: Sequence[Dict[str, object]]
+    ) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Return the target location ID and source IDs by name, or None if
+        there is nothing to migrate from."""
+
         location_by_name = {loc["name"]: str(loc["id"]) for loc in locations}
 
         if self.target_location not in location_by_name:
@@ -120,82 +755,201 @@ class ShopifyInventoryUpdater:
                 "None of the source locations %s exist in the store; nothing to do.",
                 ", ".join(self.source_locations),
             )
-            return
+            return None
+        return target_location_id, source_location_ids
 
-        total_variants = 0
-        updated_variants = 0
+    def _admin_url(self, path: str) -> str:
+        # A full base URL (e.g. http://127.0.0.1:8000) may be given instead of
+        # a bare domain so the script can be pointed at a local stand-in.
+        if self.store_domain.startswith(("http://", "https://")):
+            return f"{self.store_domain.rstrip('/')}/{path}"
+        return f"https://{self.store_domain}/{path}"
 
-        for state in self._iter_inkthreadable_variants(product_query):
-            total_variants += 1
-            actions = self._plan_actions(state, source_location_ids, target_location_id)
-            if not actions:
-                continue
-
-            updated_variants += 1
-            self._apply_actions(state, actions)
-
-        self.logger.info(
-            "Processed %d variants; updated %d variants needing location changes.",
-            total_variants,
-            updated_variants,
-        )
-
-    # ------------------------------------------------------------------
-    # Internal helpers
-    # ------------------------------------------------------------------
     def _fetch_locations(self) -> List[Dict[str, object]]:
+        cache_key = f"{self.store_domain}|{self.api_version}"
+        if self.location_cache is not None:
+            cached = self.location_cache.load(cache_key)
+            # A cache without the target location is treated as stale.
+            if cached and any(loc["name"] == self.target_location for loc in cached):
+                self.logger.debug("Using %d cached locations", len(cached))
+                self.location_count = len(cached)
+                return cached
+
         path = REST_ENDPOINT.format(version=self.api_version, path="locations.json")
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.get(url)
+        url = self._admin_url(path)
+        response = self._request("GET", url)
         self._raise_for_status(response, "Failed to fetch locations")
         payload = response.json()
-        return payload.get("locations", [])
+        locations = payload.get("locations", [])
+        self.location_count = len(locations)
+        if self.location_cache is not None:
+            self.location_cache.store(cache_key, locations)
+        return locations
 
     def _iter_inkthreadable_variants(
-        self, product_query: Optional[str]
+        self,
+        product_query: Optional[str],
+        start_cursor: Optional[str] = None,
+        on_page_complete: Optional[Callable[[str], None]] = None,
     ) -> Iterator[VariantInventoryState]:
-        cursor: Optional[str] = None
+        if self.bulk:
+            yield from self._iter_variants_bulk(product_query)
+            return
+
+        tuner = ProductPageTuner(levels_first=self.location_count or LEVELS_FIRST_DEFAULT)
+        cursor: Optional[str] = start_cursor
         while True:
-            data = self._run_graphql_query(
+            payload = self._run_graphql(
                 FETCH_PRODUCTS_QUERY,
                 {
                     "cursor": cursor,
                     "query": product_query or DEFAULT_QUERY,
+                    **tuner.variables(),
                 },
             )
 
-            products = data["products"]
+            products = payload["data"]["products"]
+            variant_counts: List[int] = []
+            variants_on_page = 0
             for edge in products["edges"]:
                 product = edge["node"]
-                product_title = product["title"]
-                for variant_edge in product["variants"]["edges"]:
-                    variant = variant_edge["node"]
-                    levels = [
-                        InventoryLevel(
-                            location_name=level_node["location"]["name"],
-                            location_id=gid_to_id(level_node["location"]["id"]),
-                            available=_extract_available_quantity(level_node),
-                        )
-                        for level_node in (
-                            level_edge["node"]
-                            for level_edge in variant["inventoryItem"]["inventoryLevels"]["edges"]
-                        )
-                    ]
-
-                    yield VariantInventoryState(
-                        variant_gid=variant["id"],
-                        sku=variant.get("sku", ""),
-                        product_title=product_title,
-                        variant_title=variant.get("title", ""),
-                        inventory_policy=variant.get("inventoryPolicy", ""),
-                        inventory_item_gid=variant["inventoryItem"]["id"],
-                        levels=levels,
+                count = 0
+                for variant in self._iter_product_variants(product, tuner):
+                    count += 1
+                    yield _build_variant_state(
+                        product["title"],
+                        variant,
+                        self._iter_level_nodes(variant),
+                        product_gid=product["id"],
                     )
+                variant_counts.append(count)
+                variants_on_page += count
+
+            actual_cost = ((payload.get("extensions") or {}).get("cost") or {}).get("actualQueryCost")
+            self.logger.debug(
+                "Fetched %d products / %d variants with sizes %s (actual cost %s)",
+                len(variant_counts),
+                variants_on_page,
+                tuner.variables(),
+                actual_cost,
+            )
+            tuner.observe(variant_counts, payload.get("extensions"))
 
             page_info = products["pageInfo"]
             if not page_info["hasNextPage"]:
                 break
             cursor = page_info["endCursor"]
+            if on_page_complete is not None:
+                on_page_complete(cursor)
+
+    def _iter_product_variants(
+        self, product: Dict[str, object], tuner: ProductPageTuner
+    ) -> Iterator[Dict[str, object]]:
+        """Yield every variant node of ``product``, paging past the first batch if needed.
+
+        Follow-up pages are sized by ``tuner`` so they stay within the query
+        cost limit however many locations each variant lists.
+        """
+
+        connection = product["variants"]
+        while True:
+            for edge in connection["edges"]:
+                yield edge["node"]
+            page_info = connection["pageInfo"]
+            if not page_info["hasNextPage"]:
+                return
+            data = self._run_graphql_query(
+                FETCH_PRODUCT_VARIANTS_QUERY,
+                {
+                    "id": product["id"],
+                    "cursor": page_info["endCursor"],
+                    "first": tuner.variant_page_size(),
+                    "levelsFirst": tuner.levels_first,
+                },
+            )
+            connection = data["product"]["variants"]
+
+    def _iter_level_nodes(self, variant: Dict[str, object]) -> Iterator[Dict[str, object]]:
+        """Yield every inventory level node of ``variant``, following its cursor if needed."""
+
+        inventory_item = variant["inventoryItem"]
+        connection = inventory_item["inventoryLevels"]
+        while True:
+            for edge in connection["edges"]:
+                yield edge["node"]
+            page_info = connection.get("pageInfo") or {}
+            if not page_info.get("hasNextPage"):
+                return
+            data = self._run_graphql_query(
+                FETCH_INVENTORY_LEVELS_QUERY,
+                {
+                    "id": inventory_item["id"],
+                    "cursor": page_info["endCursor"],
+                    "first": NESTED_PAGE_SIZE,
+                },
+            )
+            connection = data["inventoryItem"]["inventoryLevels"]
+
+    def _iter_variants_bulk(self, product_query: Optional[str]) -> Iterator[VariantInventoryState]:
+        operation_id = self._start_bulk_operation(
+            build_bulk_products_query(product_query or DEFAULT_QUERY)
+        )
+        url = self._wait_for_bulk_operation(operation_id)
+        if not url:
+            self.logger.info("Bulk operation %s returned no objects.", operation_id)
+            return
+
+        # The result URL is a signed storage link; never forward the Admin API token.
+        response = self.session.get(
+            url, stream=True, headers={"X-Shopify-Access-Token": None}
+        )
+        self._raise_for_status(response, "Failed to download bulk operation result")
+        try:
+            yield from iter_bulk_variant_states(
+                response.iter_lines(decode_unicode=True)
+            )
+        finally:
+            response.close()
+
+    def _start_bulk_operation(self, bulk_query: str) -> str:
+        data = self._run_graphql_query(RUN_BULK_OPERATION_MUTATION, {"query": bulk_query})
+        result = data["bulkOperationRunQuery"]
+        if result.get("userErrors"):
+            raise RuntimeError(f"Bulk operation rejected: {result['userErrors']}")
+        operation = result["bulkOperation"]
+        self.logger.info("Started bulk operation %s", operation["id"])
+        return operation["id"]
+
+    def _wait_for_bulk_operation(self, operation_id: str) -> Optional[str]:
+        while True:
+            data = self._run_graphql_query(CURRENT_BULK_OPERATION_QUERY, {})
+            operation = data.get("currentBulkOperation") or {}
+            if operation.get("id") != operation_id:
+                raise RuntimeError(
+                    f"Bulk operation {operation_id} is no longer the current operation."
+                )
+
+            status = operation.get("status")
+            if status == "COMPLETED":
+                self.logger.info(
+                    "Bulk operation %s completed with %s objects.",
+                    operation_id,
+                    operation.get("objectCount"),
+                )
+                return operation.get("url")
+            if status in BULK_TERMINAL_FAILURES:
+                raise RuntimeError(
+                    f"Bulk operation {operation_id} ended with status {status}: "
+                    f"{operation.get('errorCode')}"
+                )
+
+            self.logger.debug(
+                "Bulk operation %s is %s (%s objects so far)",
+                operation_id,
+                status,
+                operation.get("objectCount"),
+            )
+            time.sleep(self.bulk_poll_interval)
 
     def _plan_actions(
         self,
@@ -205,10 +959,12 @@ class ShopifyInventoryUpdater:
     ) -> List["PlannedAction"]:
         actions: List[PlannedAction] = []
         needs_target = True
+        target_quantity: Optional[int] = None
 
         for level in state.levels:
             if level.location_id == target_location_id:
                 needs_target = False
+                target_quantity = level.available
             elif level.location_id in source_location_ids.values():
                 actions.append(
                     PlannedAction(
@@ -216,18 +972,27 @@ class ShopifyInventoryUpdater:
                         location_id=level.location_id,
                         location_name=level.location_name,
                         quantity=level.available,
+                        current_quantity=level.available,
                     )
                 )
 
+        # Compare against the fetched levels: a connected target only needs its
+        # quantity set, and one already holding TARGET_QUANTITY needs nothing.
+        target_calls_avoided = 0
         if actions or needs_target:
-            actions.append(
-                PlannedAction(
-                    kind="ensure_target",
-                    location_id=target_location_id,
-                    location_name=self.target_location,
-                    quantity=999,
+            if needs_target or target_quantity != TARGET_QUANTITY:
+                actions.append(
+                    PlannedAction(
+                        kind="ensure_target",
+                        location_id=target_location_id,
+                        location_name=self.target_location,
+                        quantity=TARGET_QUANTITY,
+                        current_quantity=target_quantity,
+                    )
                 )
-            )
+                target_calls_avoided = 0 if needs_target else 1
+            else:
+                target_calls_avoided = 2
 
         if state.inventory_policy.lower() != "continue":
             actions.append(
@@ -235,15 +1000,17 @@ class ShopifyInventoryUpdater:
                     kind="set_inventory_policy",
                     location_id=target_location_id,
                     location_name=self.target_location,
-                    quantity=999,
+                    quantity=TARGET_QUANTITY,
                 )
             )
 
+        self.calls_avoided += target_calls_avoided
+        if not actions:
+            self.variants_in_sync += 1
         return actions
 
     def _apply_actions(self, state: VariantInventoryState, actions: Sequence["PlannedAction"]) -> None:
-        variant_label = f"{state.product_title} — {state.variant_title} ({state.sku or 'no SKU'})"
-        self.logger.info("Updating %s", variant_label)
+        self.logger.info("Updating %s", _variant_label(state))
 
         for action in actions:
             if action.kind == "reassign":
@@ -253,6 +1020,9 @@ class ShopifyInventoryUpdater:
             elif action.kind == "set_inventory_policy":
                 self._handle_inventory_policy(state)
 
+        if self.checkpoint is not None:
+            self.checkpoint.record_applied([state.variant_gid])
+
     def _handle_reassign(self, state: VariantInventoryState, action: "PlannedAction") -> None:
         if self.dry_run:
             self.logger.info(
@@ -275,7 +1045,8 @@ class ShopifyInventoryUpdater:
             )
             return
 
-        self._connect_location(state.inventory_item_id, action.location_id)
+        if action.current_quantity is None:
+            self._connect_location(state.inventory_item_id, action.location_id)
         self._set_inventory_level(state.inventory_item_id, action.location_id, action.quantity)
 
     def _handle_inventory_policy(self, state: VariantInventoryState) -> None:
@@ -287,8 +1058,9 @@ class ShopifyInventoryUpdater:
             version=self.api_version,
             path=f"variants/{state.variant_id}.json",
         )
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.put(
+        url = self._admin_url(path)
+        response = self._request(
+            "PUT",
             url,
             json={"variant": {"id": int(state.variant_id), "inventory_policy": "continue"}},
         )
@@ -299,8 +1071,9 @@ class ShopifyInventoryUpdater:
             version=self.api_version,
             path="inventory_levels/set.json",
         )
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.post(
+        url = self._admin_url(path)
+        response = self._request(
+            "POST",
             url,
             json={
                 "location_id": int(location_id),
@@ -315,8 +1088,9 @@ class ShopifyInventoryUpdater:
             version=self.api_version,
             path="inventory_levels/delete.json",
         )
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.delete(
+        url = self._admin_url(path)
+        response = self._request(
+            "DELETE",
             url,
             json={
                 "location_id": int(location_id),
@@ -338,8 +1112,9 @@ class ShopifyInventoryUpdater:
             version=self.api_version,
             path="inventory_levels/connect.json",
         )
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.post(
+        url = self._admin_url(path)
+        response = self._request(
+            "POST",
             url,
             json={
                 "location_id": int(location_id),
@@ -356,14 +1131,76 @@ class ShopifyInventoryUpdater:
         self._raise_for_status(response, "Failed to connect location")
 
     def _run_graphql_query(self, query: str, variables: Dict[str, object]) -> Dict[str, object]:
+        return self._run_graphql(query, variables)["data"]
+
+    def _run_graphql(self, query: str, variables: Dict[str, object]) -> Dict[str, object]:
+        """Run a GraphQL request and return the whole payload, including extensions."""
+
         path = GRAPHQL_ENDPOINT.format(version=self.api_version)
-        url = f"https://{self.store_domain}/{path}"
-        response = self.session.post(url, json={"query": query, "variables": variables})
-        self._raise_for_status(response, "GraphQL query failed")
-        payload = response.json()
+        url = self._admin_url(path)
+        operation = _operation_name(query)
+
+        for attempt in range(self.max_retries + 1):
+            reserved = self.rate_limiter.acquire_graphql(operation)
+            response = self._send_with_retries(
+                "POST",
+                url,
+                lambda: self.session.post(url, json={"query": query, "variables": variables}),
+            )
+            self._raise_for_status(response, "GraphQL query failed")
+            payload = response.json()
+            self.rate_limiter.observe_graphql(operation, reserved, payload)
+
+            if not _is_throttled(payload):
+                break
+            if attempt == self.max_retries:
+                raise RuntimeError(f"GraphQL {operation} kept being throttled")
+            self.logger.debug("GraphQL %s throttled; waiting for budget", operation)
+
         if "errors" in payload:
             raise RuntimeError(payload["errors"])
-        return payload["data"]
+        return payload
+
+    def _request(self, method: str, url: str, **kwargs: object) -> requests.Response:
+        """Send a rate-limited REST request, retrying 429/5xx responses."""
+
+        def paced_send() -> requests.Response:
+            self.rate_limiter.acquire_rest()
+            response = self.session.request(method, url, **kwargs)
+            self.rate_limiter.observe_rest(response)
+            return response
+
+        return self._send_with_retries(method, url, paced_send)
+
+    def _send_with_retries(
+        self, method: str, url: str, send: Callable[[], requests.Response]
+    ) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            with self._stats_lock:
+                self.requests_sent += 1
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"{method} {url} failed: {exc}") from exc
+                delay = backoff_delay(attempt)
+                self.logger.warning("%s %s failed (%s); retrying in %.1fs", method, url, exc, delay)
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            delay = _retry_after(response) or backoff_delay(attempt)
+            self.logger.warning(
+                "%s %s returned %d; retrying in %.1fs",
+                method,
+                url,
+                response.status_code,
+                delay,
+            )
+            time.sleep(delay)
+        return response
 
     def _raise_for_status(self, response: requests.Response, message: str) -> None:
         try:
@@ -379,19 +1216,182 @@ class ShopifyInventoryUpdater:
             raise RuntimeError(f"{message}: {response.status_code}") from exc
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class PlannedAction:
     kind: str
     location_id: str
     location_name: str
     quantity: int
+    # Units currently stocked at the location; None when it is not connected.
+    current_quantity: Optional[int] = None
+
+
+class BatchedInventoryExecutor:
+    """Applies planned actions for many variants in one GraphQL request per batch.
+
+    Top-level mutation fields execute serially, so each batch document
+    activates target locations, writes all quantities with a single
+    ``inventorySetQuantities``, deactivates source locations and finally
+    switches inventory policies — the same order the REST handlers use.
+    """
+
+    def __init__(
+        self,
+        updater: ShopifyInventoryUpdater,
+        batch_size: int,
+        pool: Optional[BoundedWorkerPool] = None,
+    ) -> None:
+        self.updater = updater
+        self.batch_size = max(1, batch_size)
+        self.pool = pool or BoundedWorkerPool(1)
+        self.requests_sent = 0
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[VariantInventoryState, Sequence[PlannedAction]]] = []
+
+    def submit(self, state: VariantInventoryState, actions: Sequence[PlannedAction]) -> None:
+        self.updater.logger.info("Queueing %s", _variant_label(state))
+        self._pending.append((state, actions))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self.pool.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch: List[Tuple[VariantInventoryState, Sequence[PlannedAction]]]) -> None:
+        document, variables = build_inventory_batch_mutation(batch)
+        if not document:
+            return
+
+        data = self.updater._run_graphql_query(document, variables)
+        with self._lock:
+            self.requests_sent += 1
+        errors = [
+            f"{alias}: {error.get('message')}"
+            for alias, result in data.items()
+            for error in (result or {}).get("userErrors") or []
+        ]
+        if errors:
+            raise RuntimeError(f"Batched inventory update failed: {'; '.join(errors)}")
+        if self.updater.checkpoint is not None:
+            self.updater.checkpoint.record_applied(state.variant_gid for state, _ in batch)
+        self.updater.logger.info("Applied batch of %d variants", len(batch))
+
+
+def build_inventory_batch_mutation(
+    batch: Sequence[Tuple[VariantInventoryState, Sequence[PlannedAction]]],
+) -> Tuple[str, Dict[str, object]]:
+    """Build one GraphQL mutation document covering every action in ``batch``.
+
+    Returns the document and its variables; the document is empty when the
+    batch contains nothing to write.
+    """
+
+    activations: List[Tuple[str, List[Dict[str, object]]]] = []
+    deactivations: List[Tuple[str, List[Dict[str, object]]]] = []
+    quantities: List[Dict[str, object]] = []
+    policy_updates: Dict[str, List[Dict[str, object]]] = {}
+
+    for state, actions in batch:
+        activate: List[Dict[str, object]] = []
+        deactivate: List[Dict[str, object]] = []
+        for action in actions:
+            location_gid = location_id_to_gid(action.location_id)
+            if action.kind == "reassign":
+                if action.quantity:
+                    quantities.append(
+                        {
+                            "inventoryItemId": state.inventory_item_gid,
+                            "locationId": location_gid,
+                            "quantity": 0,
+                        }
+                    )
+                deactivate.append({"locationId": location_gid, "activate": False})
+            elif action.kind == "ensure_target":
+                if action.current_quantity is None:
+                    activate.append({"locationId": location_gid, "activate": True})
+                quantities.append(
+                    {
+                        "inventoryItemId": state.inventory_item_gid,
+                        "locationId": location_gid,
+                        "quantity": action.quantity,
+                    }
+                )
+            elif action.kind == "set_inventory_policy":
+                policy_updates.setdefault(state.product_gid, []).append(
+                    {"id": state.variant_gid, "inventoryPolicy": "CONTINUE"}
+                )
+        if activate:
+            activations.append((state.inventory_item_gid, activate))
+        if deactivate:
+            deactivations.append((state.inventory_item_gid, deactivate))
+
+    declarations: List[str] = []
+    fields: List[str] = []
+    variables: Dict[str, object] = {}
+
+    def add_toggles(prefix: str, toggles: List[Tuple[str, List[Dict[str, object]]]]) -> None:
+        for index, (item_gid, updates) in enumerate(toggles):
+            item_var, updates_var = f"{prefix}Item{index}", f"{prefix}Updates{index}"
+            declarations.append(
+                f"${item_var}: ID!, ${updates_var}: [InventoryBulkToggleActivationInput!]!"
+            )
+            fields.append(
+                f"{prefix}{index}: inventoryBulkToggleActivation("
+                f"inventoryItemId: ${item_var}, inventoryItemUpdates: ${updates_var}) "
+                "{ userErrors { field message } }"
+            )
+            variables[item_var] = item_gid
+            variables[updates_var] = updates
 
+    add_toggles("activate", activations)
+
+    if quantities:
+        declarations.append("$quantities: InventorySetQuantitiesInput!")
+        fields.append(
+            "setQuantities: inventorySetQuantities(input: $quantities) "
+            "{ userErrors { field message } }"
+        )
+        variables["quantities"] = {
+            "name": "available",
+            "reason": "correction",
+            "ignoreCompareQuantity": True,
+            "quantities": quantities,
+        }
 
+    add_toggles("deactivate", deactivations)
+
+    for index, (product_gid, variants) in enumerate(policy_updates.items()):
+        product_var, variants_var = f"product{index}", f"variants{index}"
+        declarations.append(f"${product_var}: ID!, ${variants_var}: [ProductVariantsBulkInput!]!")
+        fields.append(
+            f"policy{index}: productVariantsBulkUpdate("
+            f"productId: ${product_var}, variants: ${variants_var}) "
+            "{ userErrors { field message } }"
+        )
+        variables[product_var] = product_gid
+        variables[variants_var] = variants
+
+    if not fields:
+        return "", {}
+
+    document = "mutation ApplyInventoryBatch({}) {{\n  {}\n}}".format(
+        ", ".join(declarations), "\n  ".join(fields)
+    )
+    return document, variables
+
+
+@lru_cache(maxsize=4096)
 def gid_to_id(gid: str) -> str:
     """Extract the numeric ID from a Shopify GID string."""
 
     if gid.isdigit():
         return gid
+    if gid.startswith("gid://"):
+        return gid.rsplit("/", 1)[-1]
 
     try:
         decoded = base64.b64decode(gid).decode()
@@ -403,6 +1403,359 @@ def gid_to_id(gid: str) -> str:
     return decoded
 
 
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter: half fixed, half random."""
+
+    ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_call_limit(header: Optional[str]) -> Tuple[int, int]:
+    """Parse ``X-Shopify-Shop-Api-Call-Limit`` (e.g. ``32/40``) into (used, limit)."""
+
+    if not header or "/" not in header:
+        return 0, 0
+    used, _, limit = header.partition("/")
+    try:
+        return int(used), int(limit)
+    except ValueError:
+        return 0, 0
+
+
+def _is_throttled(payload: Dict[str, object]) -> bool:
+    return any(
+        (error.get("extensions") or {}).get("code") == "THROTTLED"
+        for error in payload.get("errors") or []
+        if isinstance(error, dict)
+    )
+
+
+def _operation_name(query: str) -> str:
+    """Return e.g. ``query FetchProducts`` as a key for per-query cost estimates."""
+
+    header = query.strip().split("{", 1)[0].split("(", 1)[0]
+    return " ".join(header.split()) or "anonymous"
+
+
+def location_id_to_gid(location_id: str) -> str:
+    """Return the GraphQL GID for a numeric location ID."""
+
+    return f"gid://shopify/Location/{gid_to_id(location_id)}"
+
+
+def _variant_label(state: VariantInventoryState) -> str:
+    return f"{state.product_title} — {state.variant_title} ({state.sku or 'no SKU'})"
+
+
+def _gid_type(gid: str) -> str:
+    """Return the resource type of a ``gid://shopify/<Type>/<id>`` string."""
+
+    parts = gid.split("/")
+    return parts[3] if len(parts) > 4 else ""
+
+
+def _build_variant_state(
+    product_title: str,
+    variant: Dict[str, object],
+    level_nodes: Iterable[Dict[str, object]],
+    product_gid: str = "",
+) -> VariantInventoryState:
+    levels = [
+        InventoryLevel(
+            location_name=level_node["location"]["name"],
+            location_id=gid_to_id(level_node["location"]["id"]),
+            available=_extract_available_quantity(level_node),
+        )
+        for level_node in level_nodes
+    ]
+    return VariantInventoryState(
+        variant_gid=variant["id"],
+        sku=variant.get("sku") or "",
+        product_title=product_title,
+        variant_title=variant.get("title") or "",
+        inventory_policy=variant.get("inventoryPolicy") or "",
+        inventory_item_gid=variant["inventoryItem"]["id"],
+        levels=levels,
+        product_gid=product_gid,
+    )
+
+
+def iter_bulk_variant_states(lines: Iterable[str]) -> Iterator[VariantInventoryState]:
+    """Stream ``VariantInventoryState`` objects out of a bulk operation JSONL file.
+
+    Shopify writes every node of a bulk query on its own line and links nested
+    nodes to their parent through ``__parentId``. Children always follow their
+    parent, so only product titles and the variant currently being assembled
+    are held in memory.
+    """
+
+    product_titles: Dict[str, str] = {}
+    pending: Optional[Dict[str, object]] = None
+    pending_levels: List[Dict[str, object]] = []
+
+    for line in lines:
+        if not line:
+            continue
+        node = json.loads(line)
+        kind = _gid_type(node.get("id", ""))
+
+        if kind == "InventoryLevel":
+            if pending is None:
+                continue
+            parent_id = node.get("__parentId")
+            if parent_id in (pending["id"], pending["inventoryItem"]["id"]):
+                pending_levels.append(node)
+            continue
+
+        if pending is not None:
+            yield _build_variant_state(
+                product_titles.get(pending.get("__parentId", ""), ""),
+                pending,
+                pending_levels,
+                product_gid=pending.get("__parentId", ""),
+            )
+            pending = None
+            pending_levels = []
+
+        if kind == "Product":
+            product_titles[node["id"]] = node.get("title", "")
+        elif kind == "ProductVariant":
+            pending = node
+
+    if pending is not None:
+        yield _build_variant_state(
+            product_titles.get(pending.get("__parentId", ""), ""),
+            pending,
+            pending_levels,
+            product_gid=pending.get("__parentId", ""),
+        )
+
+
+def matches_product_query(product: Dict[str, object], product_query: str) -> bool:
+    """Evaluate a Shopify product search string against a REST product payload.
+
+    Only the subset used by this script is understood: ``field:value`` terms
+    (vendor, product_type, tag, title, status) joined with ``OR``, compared
+    case-insensitively. Bare words match the title.
+    """
+
+    fields = {
+        "vendor": "vendor",
+        "product_type": "product_type",
+        "title": "title",
+        "status": "status",
+    }
+    tags = {tag.strip().lower() for tag in str(product.get("tags") or "").split(",")}
+
+    for term in product_query.split(" OR "):
+        term = term.strip().strip("()").strip()
+        if not term:
+            continue
+        field, _, value = term.partition(":")
+        if not value:
+            field, value = "title", field
+        value = value.strip("'\"").lower()
+        if field == "tag":
+            if value in tags:
+                return True
+        elif field in fields:
+            actual = str(product.get(fields[field]) or "").lower()
+            if actual == value or (field == "title" and value in actual):
+                return True
+    return False
+
+
+def iter_snapshot_variants(
+    snapshot: Dict[str, object],
+    product_query: str,
+    locations_fixture: Dict[str, object],
+    fallback_location: Optional[str] = None,
+) -> Iterator[VariantInventoryState]:
+    """Build ``VariantInventoryState`` objects from a store data dump.
+
+    ``snapshot`` is the payload of snapshot/kulkid_live_dump.json. Inventory
+    levels come from ``locations_fixture["inventory_levels"]``; variants
+    without listed levels get their ``inventory_quantity`` at the fixture's
+    ``default_location`` (or ``fallback_location``). ``ValueError`` is raised
+    when such a variant is met and neither names a fixture location.
+    """
+
+    products = snapshot.get("products", [])
+    if isinstance(products, dict):
+        products = products.get("products", [])
+
+    location_names = {
+        str(loc["id"]): loc["name"] for loc in locations_fixture.get("locations", [])
+    }
+    levels_by_item: Dict[str, List[InventoryLevel]] = {}
+    for level in locations_fixture.get("inventory_levels", []):
+        location_id = str(level["location_id"])
+        levels_by_item.setdefault(str(level["inventory_item_id"]), []).append(
+            InventoryLevel(
+                location_name=location_names.get(location_id, location_id),
+                location_id=location_id,
+                available=int(level.get("available") or 0),
+            )
+        )
+
+    default_name = locations_fixture.get("default_location") or fallback_location
+    default_id = next(
+        (location_id for location_id, name in location_names.items() if name == default_name),
+        None,
+    )
+    if default_name and default_id is None:
+        raise ValueError(f"Default location '{default_name}' is not in the locations fixture.")
+
+    for product in products:
+        if not matches_product_query(product, product_query):
+            continue
+        product_gid = product.get("admin_graphql_api_id") or f"gid://shopify/Product/{product['id']}"
+        for variant in product.get("variants", []):
+            item_id = str(variant["inventory_item_id"])
+            levels = levels_by_item.get(item_id)
+            if levels is None:
+                if default_id is None:
+                    raise ValueError(
+                        f"Variant {variant['id']} has no inventory_levels in the locations fixture and "
+                        "no default_location says where its inventory_quantity is held; add "
+                        '"default_location" to the fixture or pass --target-location explicitly.'
+                    )
+                levels = [
+                    InventoryLevel(
+                        location_name=default_name,
+                        location_id=default_id,
+                        available=int(variant.get("inventory_quantity") or 0),
+                    )
+                ]
+            yield VariantInventoryState(
+                variant_gid=variant.get("admin_graphql_api_id")
+                or f"gid://shopify/ProductVariant/{variant['id']}",
+                sku=variant.get("sku") or "",
+                product_title=product.get("title", ""),
+                variant_title=variant.get("title") or "",
+                inventory_policy=variant.get("inventory_policy") or "",
+                inventory_item_gid=f"gid://shopify/InventoryItem/{item_id}",
+                levels=list(levels),
+                product_gid=product_gid,
+            )
+
+
+def plan_records(
+    plan: Iterable[Tuple[VariantInventoryState, Sequence[PlannedAction]]],
+) -> List[Dict[str, object]]:
+    """Flatten a plan into one record per action, sorted by variant.
+
+    ``seq`` keeps each variant's actions in planning order, so the sorted
+    output is stable and diffs cleanly between runs.
+    """
+
+    records = [
+        {
+            "variant": state.variant_gid,
+            "seq": seq,
+            **asdict(action),
+            "item": state.inventory_item_gid,
+            "product": state.product_gid,
+            "product_title": state.product_title,
+            "variant_title": state.variant_title,
+            "sku": state.sku,
+        }
+        for state, actions in plan
+        for seq, action in enumerate(actions)
+    ]
+    records.sort(key=lambda record: (record["variant"], record["seq"]))
+    return records
+
+
+def write_plan(records: Iterable[Dict[str, object]], handle) -> None:
+    for record in records:
+        handle.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def read_plan(
+    lines: Iterable[str], stats: Optional[Dict[str, int]] = None
+) -> Iterator[Tuple[VariantInventoryState, List[PlannedAction]]]:
+    """Stream (state, actions) pairs back out of a plan written by ``write_plan``.
+
+    Records of one variant must be contiguous, which sorted plan files
+    guarantee. Repeated actions and ``ensure_target`` actions whose location
+    already holds the wanted quantity are dropped and counted in
+    ``stats["deduplicated"]``.
+    """
+
+    stats = stats if stats is not None else {}
+    stats.setdefault("records", 0)
+    stats.setdefault("deduplicated", 0)
+
+    def finish(group: List[Dict[str, object]]) -> Optional[Tuple[VariantInventoryState, List[PlannedAction]]]:
+        first = group[0]
+        seen = set()
+        actions: List[PlannedAction] = []
+        for record in group:
+            action = PlannedAction(
+                kind=record["kind"],
+                location_id=str(record["location_id"]),
+                location_name=record["location_name"],
+                quantity=int(record["quantity"]),
+                current_quantity=record.get("current_quantity"),
+            )
+            key = (action.kind, action.location_id, action.quantity)
+            redundant = key in seen or (
+                action.kind == "ensure_target" and action.current_quantity == action.quantity
+            )
+            seen.add(key)
+            if redundant:
+                stats["deduplicated"] += 1
+                continue
+            actions.append(action)
+        if not actions:
+            return None
+        state = VariantInventoryState(
+            variant_gid=first["variant"],
+            sku=first.get("sku") or "",
+            product_title=first.get("product_title") or "",
+            variant_title=first.get("variant_title") or "",
+            inventory_policy="",
+            inventory_item_gid=first["item"],
+            levels=[],
+            product_gid=first.get("product") or "",
+        )
+        return state, actions
+
+    group: List[Dict[str, object]] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        stats["records"] += 1
+        if group and record["variant"] != group[0]["variant"]:
+            result = finish(group)
+            if result is not None:
+                yield result
+            group = []
+        group.append(record)
+
+    if group:
+        result = finish(group)
+        if result is not None:
+            yield result
+
+
+def build_bulk_products_query(product_query: str) -> str:
+    """Return the bulk operation variant of ``FETCH_PRODUCTS_QUERY``."""
+
+    return BULK_PRODUCTS_QUERY.replace("$query", json.dumps(product_query))
+
+
 def _extract_available_quantity(level_node: Dict[str, object]) -> int:
     quantity = level_node.get("available")
     if quantity is None:
@@ -411,14 +1764,124 @@ def _extract_available_quantity(level_node: Dict[str, object]) -> int:
         return 0
     return int(quantity)
 
+VARIANT_INVENTORY_FRAGMENT = """
+fragment VariantInventory on ProductVariant {
+  id
+  title
+  sku
+  inventoryPolicy
+  inventoryItem {
+    id
+    inventoryLevels(first: $levelsFirst) {
+      edges {
+        node {
+          ...LevelFields
+        }
+      }
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+    }
+  }
+}
+"""
+
 # Updated for Shopify Admin API 2024-07: replaced 'available' with 'availableQuantity'
+LEVEL_FIELDS_FRAGMENT = """
+fragment LevelFields on InventoryLevel {
+  id
+  availableQuantity
+  location {
+    id
+    name
+  }
+}
+"""
+
+# Page sizes are variables so ProductPageTuner can adjust them between pages;
+# nested connections expose pageInfo and are completed by follow-up queries.
 FETCH_PRODUCTS_QUERY = """
-query FetchProducts($cursor: String, $query: String) {
-  products(first: 50, after: $cursor, query: $query) {
+query FetchProducts(
+  $cursor: String
+  $query: String
+  $first: Int!
+  $variantsFirst: Int!
+  $levelsFirst: Int!
+) {
+  products(first: $first, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        title
+        variants(first: $variantsFirst) {
+          edges {
+            node {
+              ...VariantInventory
+            }
+          }
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+""" + VARIANT_INVENTORY_FRAGMENT + LEVEL_FIELDS_FRAGMENT
+
+FETCH_PRODUCT_VARIANTS_QUERY = """
+query FetchProductVariants($id: ID!, $cursor: String, $first: Int!, $levelsFirst: Int!) {
+  product(id: $id) {
+    variants(first: $first, after: $cursor) {
+      edges {
+        node {
+          ...VariantInventory
+        }
+      }
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+    }
+  }
+}
+""" + VARIANT_INVENTORY_FRAGMENT + LEVEL_FIELDS_FRAGMENT
+
+FETCH_INVENTORY_LEVELS_QUERY = """
+query FetchInventoryLevels($id: ID!, $cursor: String, $first: Int!) {
+  inventoryItem(id: $id) {
+    inventoryLevels(first: $first, after: $cursor) {
+      edges {
+        node {
+          ...LevelFields
+        }
+      }
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+    }
+  }
+}
+""" + LEVEL_FIELDS_FRAGMENT
+
+
+# Bulk operations do not accept variables or pagination arguments; the product
+# filter is spliced in by build_bulk_products_query().
+BULK_PRODUCTS_QUERY = """
+{
+  products(query: $query) {
     edges {
       node {
+        id
         title
-        variants(first: 100) {
+        variants {
           edges {
             node {
               id
@@ -427,16 +1890,14 @@ query FetchProducts($cursor: String, $query: String) {
               inventoryPolicy
               inventoryItem {
                 id
-                inventoryLevels(first: 10) {
+                inventoryLevels {
                   edges {
                     node {
                       id
                       availableQuantity
                       location {
-                        name
-                      }
-                      inventoryItem {
                         id
+                        name
                       }
                     }
                   }
@@ -447,14 +1908,37 @@ query FetchProducts($cursor: String, $query: String) {
         }
       }
     }
-    pageInfo {
-      hasNextPage
-      endCursor
+  }
+}
+"""
+
+RUN_BULK_OPERATION_MUTATION = """
+mutation RunBulkQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
     }
   }
 }
 """
 
+CURRENT_BULK_OPERATION_QUERY = """
+query CurrentBulkOperation {
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+"""
+
 
 def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -480,8 +1964,8 @@ def build_arg_parser() -> argparse.ArgumentParser:
     )
     parser.add_argument(
         "--target-location",
-        default=os.getenv("INKTHREADABLE_TARGET_LOCATION", DEFAULT_TARGET_LOCATION),
-        help="Target location name to assign inventory to",
+        default=os.getenv("INKTHREADABLE_TARGET_LOCATION"),
+        help=f"Target location name to assign inventory to (default: {DEFAULT_TARGET_LOCATION})",
     )
     parser.add_argument(
         "--source-locations",
@@ -493,6 +1977,83 @@ def build_arg_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Log planned changes without modifying Shopify data",
     )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Discover variants with a bulk operation instead of paginated queries",
+    )
+    parser.add_argument(
+        "--bulk-poll-interval",
+        type=float,
+        default=BULK_POLL_INTERVAL_DEFAULT,
+        help="Seconds to wait between bulk operation status checks",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=int(os.getenv("INKTHREADABLE_BATCH_SIZE", BATCH_SIZE_DEFAULT)),
+        help="Variants per batched GraphQL mutation (0 uses per-variant REST calls)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=MAX_RETRIES_DEFAULT,
+        help="Retries for throttled (429/THROTTLED) or failed (5xx) requests",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("INKTHREADABLE_CONCURRENCY", "1")),
+        help="Worker threads applying changes; they share one rate-limit budget",
+    )
+    parser.add_argument(
+        "--state-file",
+        default=os.getenv("INKTHREADABLE_STATE_FILE", STATE_FILE_DEFAULT),
+        help="JSONL file recording migration progress for --resume",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted migration from --state-file",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        metavar="PATH",
+        help="Plan offline from a store dump (e.g. snapshot/kulkid_live_dump.json)",
+    )
+    parser.add_argument(
+        "--locations-fixture",
+        metavar="PATH",
+        help="locations.json-style fixture used with --from-snapshot",
+    )
+    parser.add_argument(
+        "--locations-cache",
+        default=os.getenv("INKTHREADABLE_LOCATIONS_CACHE", LOCATIONS_CACHE_DEFAULT),
+        help="JSON file caching store locations between runs",
+    )
+    parser.add_argument(
+        "--locations-cache-ttl",
+        type=float,
+        default=LOCATIONS_CACHE_TTL_DEFAULT,
+        help="Seconds cached locations stay valid (0 disables the cache)",
+    )
+
+    subcommands = parser.add_subparsers(
+        dest="command",
+        metavar="{plan,apply}",
+        help="Run only one phase; without a subcommand variants are planned and applied together",
+    )
+    plan_parser = subcommands.add_parser("plan", help="Discover variants and write an action plan")
+    plan_parser.add_argument(
+        "--plan-output",
+        metavar="PATH",
+        default="-",
+        help="Where to write the JSONL action plan (default: stdout)",
+    )
+    # --from-snapshot without a subcommand also writes a plan, to stdout
+    parser.set_defaults(plan_output="-")
+    apply_parser = subcommands.add_parser("apply", help="Apply a plan written by 'plan'")
+    apply_parser.add_argument("plan_file", help="JSONL plan file ('-' reads stdin)")
     parser.add_argument(
         "--log-level",
         default=os.getenv("LOG_LEVEL", "INFO"),
@@ -508,42 +2069,136 @@ def configure_logging(level: str) -> None:
     )
 
 
-def main(argv: Optional[Sequence[str]] = None) -> int:
-    parser = build_arg_parser()
-    args = parser.parse_args(argv)
-
-    if not args.store_domain:
-        parser.error("--store-domain or SHOPIFY_STORE_DOMAIN is required")
-    if not args.access_token:
-        parser.error("--access-token or SHOPIFY_ACCESS_TOKEN is required")
-
-    configure_logging(args.log_level)
-
+def build_session(access_token: str) -> requests.Session:
     session = requests.Session()
     session.headers.update(
         {
-            "X-Shopify-Access-Token": args.access_token,
+            "X-Shopify-Access-Token": access_token,
             "Content-Type": "application/json",
             "Accept": "application/json",
         }
     )
+    return session
+
+
+def snapshot_plan(
+    args: argparse.Namespace, updater: ShopifyInventoryUpdater
+) -> Iterator[Tuple[VariantInventoryState, List[PlannedAction]]]:
+    with open(args.from_snapshot, "r", encoding="utf-8") as handle:
+        snapshot = json.load(handle)
+    with open(args.locations_fixture, "r", encoding="utf-8") as handle:
+        locations_fixture = json.load(handle)
+
+    # Only an explicitly chosen target may stand in for a missing default_location
+    states = iter_snapshot_variants(
+        snapshot,
+        args.product_query or DEFAULT_QUERY,
+        locations_fixture,
+        fallback_location=args.target_location if args.target_location_explicit else None,
+    )
+    return updater.plan(states, locations_fixture.get("locations", []))
 
+
+def write_plan_output(path: str, records: List[Dict[str, object]]) -> None:
+    if path == "-":
+        write_plan(records, sys.stdout)
+        return
+    with open(path, "w", encoding="utf-8") as handle:
+        write_plan(records, handle)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    args.target_location_explicit = args.target_location is not None
+    args.target_location = args.target_location or DEFAULT_TARGET_LOCATION
     source_locations = [name.strip() for name in args.source_locations.split(",") if name.strip()]
+    logger = logging.getLogger(__name__)
+    offline = bool(args.from_snapshot)
+
+    if offline:
+        if args.command == "apply":
+            parser.error("--from-snapshot only produces plans; it cannot be used with apply")
+        if not args.locations_fixture:
+            parser.error("--locations-fixture is required with --from-snapshot")
+    else:
+        if not args.store_domain:
+            parser.error("--store-domain or SHOPIFY_STORE_DOMAIN is required")
+        if not args.access_token:
+            parser.error("--access-token or SHOPIFY_ACCESS_TOKEN is required")
+
+    configure_logging(args.log_level)
+
+    checkpoint = None
+    if not args.dry_run and not offline and args.command != "plan":
+        if args.command == "apply":
+            run_key: Dict[str, object] = {"plan": os.path.abspath(args.plan_file)}
+        else:
+            run_key = {
+                "query": args.product_query,
+                "target": args.target_location,
+                "sources": source_locations,
+            }
+        checkpoint = MigrationCheckpoint.open(args.state_file, run_key, resume=args.resume)
 
     updater = ShopifyInventoryUpdater(
-        session=session,
-        store_domain=args.store_domain,
+        session=None if offline else build_session(args.access_token),
+        store_domain=args.store_domain or "snapshot",
         api_version=args.api_version,
         target_location=args.target_location,
         source_locations=source_locations,
-        dry_run=args.dry_run,
+        dry_run=args.dry_run or offline,
+        bulk=args.bulk,
+        bulk_poll_interval=args.bulk_poll_interval,
+        batch_size=args.batch_size,
+        max_retries=args.max_retries,
+        concurrency=1 if offline else args.concurrency,
+        checkpoint=checkpoint,
+        location_cache=(
+            LocationCache(args.locations_cache, args.locations_cache_ttl)
+            if args.locations_cache_ttl > 0
+            else None
+        ),
     )
 
     try:
-        updater.run(args.product_query)
+        if offline or args.command == "plan":
+            started = time.perf_counter()
+            if offline:
+                plan = snapshot_plan(args, updater)
+            else:
+                plan = updater.plan_live(args.product_query)
+            records = plan_records(plan)
+            write_plan_output(args.plan_output, records)
+            updater.log_planning_savings()
+            logger.info(
+                "Planned %d actions for %d variants in %.1f ms.",
+                len(records),
+                len({record["variant"] for record in records}),
+                (time.perf_counter() - started) * 1000,
+            )
+        elif args.command == "apply":
+            stats: Dict[str, int] = {}
+            if args.plan_file == "-":
+                updater.apply_plan(read_plan(sys.stdin, stats))
+            else:
+                with open(args.plan_file, "r", encoding="utf-8") as handle:
+                    updater.apply_plan(read_plan(handle, stats))
+            logger.info(
+                "Read %d plan records; dropped %d redundant actions.",
+                stats["records"],
+                stats["deduplicated"],
+            )
+        else:
+            updater.run(args.product_query)
     except Exception as exc:  # pragma: no cover - CLI entry point
-        logging.getLogger(__name__).error("%s", exc)
+        logger.error("%s", exc)
+        if checkpoint is not None:
+            logger.info("Progress saved to %s; rerun with --resume to continue.", args.state_file)
         return 1
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
     return 0
 
 
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import update_inkthreadable_inventory as inventory  # noqa: E402
+
+
+@pytest.mark.parametrize("locations", [1, 4, 10])
+def test_variant_follow_up_page_stays_within_cost_target(locations):
+    tuner = inventory.ProductPageTuner(levels_first=locations)
+    page_size = tuner.variant_page_size()
+
+    assert 1 <= page_size <= inventory.NESTED_PAGE_SIZE
+    assert tuner.estimate_variant_page_cost(page_size) <= inventory.QUERY_COST_TARGET